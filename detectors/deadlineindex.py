@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-#
+# @(#)deadlineindex.py
+#
+#
+# Copyright (C) 2018, S3IT, University of Zurich. All rights reserved.
+#
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+__docformat__ = 'reStructuredText'
+
+import deadlineindex
+
+
+def index_deadline(db, cl, nodeid, oldvalues):
+    ''' Record in the deadline index (see lib/deadlineindex.py) the
+        deadline and status of the issue, when the transaction is
+        committed.
+    '''
+    if oldvalues is not None and 'deadline' in oldvalues and 'status' in oldvalues:
+        if (oldvalues['deadline'] == cl.get(nodeid, 'deadline') and
+                oldvalues['status'] == cl.get(nodeid, 'status')):
+            return
+    # if the index doesn't exist yet, it's built from the database at
+    # the first query
+    index = deadlineindex.get_index(db, build=False)
+    db.transactions.append((index.update, (nodeid, deadlineindex.entry(db, nodeid))))
+
+
+def init(db):
+    # fire after changes are made
+    db.issue.react('create', index_deadline)
+    db.issue.react('set', index_deadline)
+    db.issue.react('retire', index_deadline)
+    db.issue.react('restore', index_deadline)
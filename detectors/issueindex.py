@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-#
+# @(#)issueindex.py
+#
+#
+# Copyright (C) 2018, S3IT, University of Zurich. All rights reserved.
+#
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+__docformat__ = 'reStructuredText'
+
+import issueindex
+
+
+def index_messages_and_files(db, cl, nodeid, oldvalues):
+    ''' Record in the issue index (see lib/issueindex.py) the messages
+        and files added to or removed from the issue, when the
+        transaction is committed.
+    '''
+    added = {}
+    removed = {}
+    for classname, propname in issueindex.PROPERTIES.items():
+        new = cl.get(nodeid, propname)
+        if oldvalues is None:
+            old = []
+        else:
+            old = oldvalues.get(propname, new)
+        added[classname] = [itemid for itemid in new if itemid not in old]
+        removed[classname] = [itemid for itemid in old if itemid not in new]
+    if any(added.values()) or any(removed.values()):
+        index = issueindex.get_index(db.config.DATABASE)
+        db.transactions.append((index.update, (nodeid, added, removed)))
+
+
+def unindex_retired(db, cl, nodeid, oldvalues):
+    ''' Forget the messages and files of a retired issue, or index
+        them again when it's restored.
+    '''
+    items = dict((classname, cl.get(nodeid, propname))
+                 for classname, propname in issueindex.PROPERTIES.items())
+    index = issueindex.get_index(db.config.DATABASE)
+    if cl.is_retired(nodeid):
+        db.transactions.append((index.update, (nodeid, {}, items)))
+    else:
+        db.transactions.append((index.update, (nodeid, items, {})))
+
+
+def init(db):
+    # fire after changes are made
+    db.issue.react('create', index_messages_and_files)
+    db.issue.react('set', index_messages_and_files)
+    db.issue.react('retire', unindex_retired)
+    db.issue.react('restore', unindex_retired)
@@ -23,9 +23,10 @@
 __docformat__ = 'reStructuredText'
 __author__ = 'Antonio Messina <antonio.s.messina@gmail.com>'
 
-import os
 import ldap
-from ConfigParser import RawConfigParser
+
+import ldapconfig
+import ldapmailcache
 
 from roundup.exceptions import Reject
 
@@ -39,42 +40,76 @@ def ldapuserauditor(db, cl, nodeid, newvalues):
     interface, using their UZH `short name`, and at the same time
     to avoid spam.
 
+    The result of the LDAP search is cached (see `lib/ldapmailcache.py`),
+    including the addresses which are not found, so that repeated
+    messages from the same spammer do not query LDAP again.
+
     """
     if 'address' not in newvalues:
         return
 
+    if getattr(db, 'tx_Source', None) == 'ldapsync':
+        # the user comes from LDAP already (see scripts/roundup-ldapsync)
+        return
+
     log = db.get_logger().getChild('ldapuserauditor')
 
-    ldap_conf_file = os.path.join(db.config.ext['HOME'], 'ldap_config.ini')
-    if not os.path.exists(ldap_conf_file):
-        log.info("Ldap configuration file %s not found. Exiting", ldap_conf_file)
+    cfg = ldapconfig.get_config(db.config.ext['HOME'], log)
+    if cfg is None or not cfg.has_section:
         return
         # raise Reject('Ldap not configured')
 
-    cfg = RawConfigParser()
-    cfg.read(ldap_conf_file)
-    if not cfg.has_section('ldap'):
-        log.info("No section 'ldap' in configuration file %s. Exiting", ldap_conf_file)
+    missing = cfg.missing(['server_uri', 'search_bind_dn', 'search_bind_pw',
+                           'base_dn', 'aliasname_attribute',
+                           'surname_attribute', 'givenname_attribute'])
+    if missing:
+        log.info("Missing mandatory option `%s` in ldap configuration file %s",
+                 missing[0], cfg.path)
         return
-        # raise Reject('Ldap not configured')
+        # raise Reject('Missing mandatory option %s in ldap configuration file' % opt)
+
+    address = newvalues['address']
+    cache = ldapmailcache.get_cache(db.config.DATABASE)
+    users = cache.lookup(address)
+    if users is None:
+        users = search_users(cfg, address, log)
+        if users:
+            ttl = cfg.options.get('mail_cache_ttl',
+                                  ldapmailcache.DEFAULT_TTL)
+        else:
+            ttl = cfg.options.get('mail_negative_cache_ttl',
+                                  ldapmailcache.DEFAULT_NEGATIVE_TTL)
+        cache.store(address, users, ttl)
+    else:
+        log.debug("Found %d cached ldap entries for address %s",
+                  len(users), address)
+
+    if not users:
+        log.error("User with email address %s not found in database",
+                  address)
+        return
+        # raise Reject('User not found in LDAP database')
+
+    # In some cases we might have 2 users with the same email. Cfr. asutter and kzihp
+    uid, realname = users[0]
+    for u in users:
+        if newvalues.get('username') == u[0]:
+            uid, realname = u
+            break
 
-    for opt in ['server_uri', 'search_bind_dn', 'search_bind_pw', 'base_dn',
-                'aliasname_attribute', 'surname_attribute',
-                'givenname_attribute']:
-        if not cfg.has_option('ldap', opt):
-            log.info("Missing mandatory option `%s` in ldap configuration file %s",
-                     opt, ldap_conf_file)
-            return
-            # raise Reject('Missing mandatory option %s in ldap configuration file' % opt)
-
-    server_uri = cfg.get('ldap', 'server_uri')
-    search_bind_dn = cfg.get('ldap', 'search_bind_dn')
-    search_bind_pw = cfg.get('ldap', 'search_bind_pw')
-    base_dn = cfg.get('ldap', 'base_dn')
-    aliasname_attribute = cfg.get('ldap', 'aliasname_attribute')
-    surname_attribute = cfg.get('ldap', 'surname_attribute')
-    givenname_attribute = cfg.get('ldap', 'givenname_attribute')
-    searchfilter = "mail=%s" % newvalues['address']
+    newvalues['username'] = uid
+    newvalues['realname'] = realname
+    log.info("Updated realname (%s) and username (%s) for user with address %s.",
+             newvalues['realname'], newvalues['username'], newvalues['address'])
+
+def search_users(cfg, address, log):
+    """Return the list of `(uid, realname)` of the LDAP entries with
+    email address `address`."""
+    server_uri = cfg.options['server_uri']
+    search_bind_dn = cfg.options['search_bind_dn']
+    search_bind_pw = cfg.options['search_bind_pw']
+    base_dn = cfg.options['base_dn']
+    searchfilter = "mail=%s" % address
 
     ldap.set_option(ldap.OPT_PROTOCOL_VERSION, ldap.VERSION3)
     ldap.set_option(ldap.OPT_REFERRALS, 0)
@@ -87,34 +122,9 @@ def ldapuserauditor(db, cl, nodeid, newvalues):
     
     log.debug("Searching user with search filter '%s'", searchfilter)
     users = l.search_st(base_dn, ldap.SCOPE_SUBTREE, searchfilter)
-    if not users:
-        log.error("User with email address %s not found in database",
-                  newvalues['address'])
-        return
-        # raise Reject('User not found in LDAP database')
-
-    # In some cases we might have 2 users with the same email. Cfr. asutter and kzihp
-    user = users[0][1]
-    for u in users:
-        if newvalues.get('username') == u[1]['uid'][0]:
-            user = u[1]
-            break
-
-    newvalues['username'] = user['uid'][0]
-    aliasname = ''
-    if aliasname_attribute in user:
-        aliasname = user[aliasname_attribute][0]
-    if not aliasname:
-        sn = user[surname_attribute][0]
-        gn = user[givenname_attribute][0]
-        if sn and gn:
-            aliasname = "%s, %s" % (sn, gn)
-        elif sn:
-            aliasname = sn
-
-    newvalues['realname'] = aliasname
-    log.info("Updated realname (%s) and username (%s) for user with address %s.",
-             newvalues['realname'], newvalues['username'], newvalues['address'])
+    l.unbind_s()
+    return [(user['uid'][0], cfg.realname(user))
+            for dn, user in users if dn is not None and 'uid' in user]
 
 def init(db):
     db.user.audit('create', ldapuserauditor)
@@ -2,6 +2,10 @@ from roundup.anypy.sets_ import set
 
 from roundup import roundupdb, hyperdb
 
+import outbox
+import roleindex
+import smtppool
+
 def nosyreaction(db, cl, nodeid, oldvalues):
     ''' A standard detector is provided that watches for additions to the
         "messages" property.
@@ -19,6 +23,9 @@ def nosyreaction(db, cl, nodeid, oldvalues):
     '''
     # send a copy of all new messages to the nosy list
     log = db.get_logger().getChild('nosyreaction')
+    # with the outbox enabled, the messages are only queued, and sent
+    # by scripts/roundup-outbox after the commit.
+    box = outbox.get_outbox(db.config, log)
     messages = determineNewMessages(cl, nodeid, oldvalues)
     issue = db.issue.getnode(nodeid)
     spamstatus = db.status.lookup('spam')
@@ -31,15 +38,18 @@ def nosyreaction(db, cl, nodeid, oldvalues):
                     # message. cl.nosymessage() will only send
                     # messages to people who are not member of the
                     # msg.recipients attribute...
-                    msgrecipients = [i for i in issue.nosy if 'Operator' not in db.user.get(i, 'roles').split(',')]
+                    operators = roleindex.get_index(db).users_with('Operator')
+                    msgrecipients = [i for i in issue.nosy if i not in operators]
                     newcontent = '=== Internal message - this message was only sent to Roundup Operators ===\n\n' + db.msg.get(msgid, 'content')
                     db.msg.set(msgid, recipients=msgrecipients, content=newcontent)
                     log.info("Sending INTERNAL message for issue %s with update message %s", nodeid, msgid)
 
-                    cl.nosymessage(nodeid, msgid, oldvalues)
+                    with outbox.capture(db, box):
+                        cl.nosymessage(nodeid, msgid, oldvalues)
                 else:
                     log.info("Sending message for issue %s with update message %s", nodeid, msgid)
-                    cl.nosymessage(nodeid, msgid, oldvalues)
+                    with outbox.capture(db, box):
+                        cl.nosymessage(nodeid, msgid, oldvalues)
         except roundupdb.MessageSendError, message:
             log.error("Error while sending nosy reaction for msg id %s: %s", msgid, message)
             raise roundupdb.DetectorError, message
@@ -55,7 +65,8 @@ def nosyreaction(db, cl, nodeid, oldvalues):
                 if issue.status != spamstatus:
                     # Only send message if it's not spam
                     log.info("Sending message for issue %s", nodeid)
-                    cl.nosymessage(nodeid, None, oldvalues)
+                    with outbox.capture(db, box):
+                        cl.nosymessage(nodeid, None, oldvalues)
         except roundupdb.MessageSendError, message:
             log.error("Error while sending messages for issue %s without update message: %s", nodeid, message)
             raise roundupdb.DetectorError, message
@@ -152,6 +163,8 @@ def updatenosy(db, cl, nodeid, newvalues):
         newvalues['nosy'] = list(new_nosy)
 
 def init(db):
+    # reuse the SMTP connections for all the messages sent by roundup
+    smtppool.install()
     db.issue.react('create', nosyreaction)
     db.issue.react('set', nosyreaction)
     db.issue.audit('create', updatenosy)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-#
+# @(#)permcache.py
+#
+#
+# Copyright (C) 2018, S3IT, University of Zurich. All rights reserved.
+#
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+__docformat__ = 'reStructuredText'
+
+import permcache
+
+
+def forget_decisions(db, cl, nodeid, newvalues):
+    ''' Stop caching the permission checks (see lib/permcache.py)
+        for the rest of the transaction when an issue is created or
+        changed, since they depend on its creator, nosy list,
+        visibility, messages and files.
+
+        This is an auditor, so that no reactor sees the decisions
+        taken before the change.
+    '''
+    permcache.get_cache(db).suspend()
+
+
+def init(db):
+    # fire before changes are made
+    db.issue.audit('create', forget_decisions)
+    db.issue.audit('set', forget_decisions)
+    db.issue.audit('retire', forget_decisions)
+    db.issue.audit('restore', forget_decisions)
@@ -29,83 +29,83 @@ user = <username>
 token = <token/password>
 room_id = <room id>
 channel = <channel with #>
+# optional, seconds to wait for the server (default 10)
+timeout = <seconds>
+
+# optional, set to "yes" to queue the notifications on disk instead of
+# sending them immediately; scripts/roundup-chatspool delivers them.
+spool = yes
+# optional, with spool enabled: seconds to wait before delivering a
+# notification, merging all the changes to the issue made meanwhile
+# in a single message (default 0)
+coalesce_window = <seconds>
+
+The login token is kept by the process and reused for the following
+notifications (see `lib/chatclient.py`).
 """
 
 __docformat__ = 'reStructuredText'
 __author__ = 'Pim Witlox <pim.witlox@uzh.ch>'
 
-import json
-import requests
+import os
 
+import chatclient
+import chatnotify
+import chatspool
 
-def notify_rocket(db, issue_id, msgs, color, body):
+
+def build_message(db, notification):
+    """Return the `chat.postMessage` data for `notification` (see
+    `lib/chatnotify.py`)."""
+    cfg = db.config.detectors
+    return chatnotify.post_message_data(notification, db.config.TRACKER_WEB,
+                                        cfg['ROCKETCHAT_ROOM_ID'],
+                                        cfg['ROCKETCHAT_CHANNEL'])
+
+
+def get_spool(db):
+    """Return the notification spool, or None if notifications are
+    sent directly."""
+    try:
+        enabled = db.config.detectors['ROCKETCHAT_SPOOL']
+    except KeyError:
+        return None
+    if enabled.lower() not in ('yes', 'true', '1'):
+        return None
+    return chatspool.Spool(os.path.join(db.config.DATABASE, 'chatspool'),
+                           db.get_logger().getChild('chatspool'))
+
+
+def notify_rocket(db, notification):
     log = db.get_logger().getChild('rocketchat')
     try:
         cfg = db.config.detectors
         base_url = cfg['ROCKETCHAT_BASE_URL']
         user = cfg['ROCKETCHAT_USER']
         token = cfg['ROCKETCHAT_TOKEN']
-        room_id = cfg['ROCKETCHAT_ROOM_ID']
-        channel = cfg['ROCKETCHAT_CHANNEL']
+        issue_data = build_message(db, notification)
     except Exception as ex:
         log.error("Config options not found. Check detectors/config.ini for rocketchat options")
         return
 
-    try:
-        headers = {"Content-Type": "application/json"}
-        login_uri = "{0}/api/v1/login".format(base_url)
-        logout_uri = "{0}/api/v1/logout".format(base_url)
-        post_message_uri = "{0}/api/v1/chat.postMessage".format(base_url)
-
-        login_data = {
-            "username": user,
-            "password": token
-        }
-        login_response = requests.post(login_uri, data=json.dumps(login_data), headers=headers)
-        if login_response.status_code != 200:
-            raise Exception("failed to login to {0} ({1}): {2}".format(
-                login_uri, login_response.status_code, login_response.text))
-        login_data = json.loads(login_response.text)
-        if login_data["status"] == "success":
-            log.debug("successfully logged in on {0}".format(base_url))
-        else:
-            raise Exception("failed to login on {0}: {1}".format(base_url, login_data))
-
-        headers["X-Auth-Token"] = login_data["data"]["authToken"]
-        headers["X-User-Id"] = login_data["data"]["userId"]
-
-        issue_data = {
-            "roomId": room_id,
-            "channel": channel,
-            "text": "{0}issue{1} *{2}*".format(db.config.TRACKER_WEB, issue_id, body),
-            "attachments": [{
-                "text": "\n".join(msgs),
-                "color": color
-            }]
-        }
-
-        issue_response = requests.post(post_message_uri, data=json.dumps(issue_data), headers=headers)
-        if issue_response.status_code != 200:
-            raise Exception("failed to post issue to {0} ({1}): {2}".format(
-                post_message_uri, issue_response.status_code, issue_response.text))
-        issue_data = json.loads(issue_response.text)
-        if issue_data["success"]:
-            log.debug("successfully sent message {0} to {1} ({2})".format(issue_data, base_url, channel))
-        else:
-            raise Exception("failed send message to {0} ({1}): {2}".format(base_url, channel, issue_data))
-
-        del headers["Content-Type"]
+    spool = get_spool(db)
+    if spool is not None:
+        # written when the transaction is committed, and delivered
+        # by scripts/roundup-chatspool, which merges the notifications
+        # about the same issue.
+        db.transactions.append((spool.enqueue, (
+            {'key': 'issue' + notification['issue_id'],
+             'notification': notification},)))
+        return
 
-        logout_response = requests.post(logout_uri, headers=headers)
-        if logout_response.status_code != 200:
-            raise Exception("failed to logout to {0} ({1}): {2}".format(
-                logout_uri, logout_response.status_code, logout_response.text))
-        logout_data = json.loads(logout_response.text)
-        if logout_data["status"] == "success":
-            log.debug("successfully logged out of {0}".format(base_url))
-        else:
-            raise Exception("failed to logout from {0}: {1}".format(base_url, logout_data))
+    try:
+        timeout = int(cfg['ROCKETCHAT_TIMEOUT'])
+    except (KeyError, ValueError):
+        timeout = chatclient.DEFAULT_TIMEOUT
 
+    try:
+        client = chatclient.get_client(base_url, user, token, timeout, log)
+        client.post_message(issue_data)
     except Exception as ex:
         log.warning("Unable to send message to rocketchat. error: %s", ex)
 
@@ -113,14 +113,24 @@ def notify_rocket(db, issue_id, msgs, color, body):
 def newissue(db, cl, nodeid, oldvalues):
     issue = db.issue.getnode(nodeid)
 
-    msg = "NEW issue{0} has been created by {1}".format(nodeid, db.user.get(issue.creator, 'username'))
-
-    notify_rocket(db, nodeid, [msg], "red", issue.title)
+    notify_rocket(db, {
+        'issue_id': nodeid,
+        'title': issue.title,
+        'color': "red",
+        'creator': db.user.get(issue.creator, 'username'),
+    })
 
 
 def issueupdate(db, cl, nodeid, oldvalues):
     issue = db.issue.getnode(nodeid)
-    allmsg = []
+    changes = {}
+    followups = []
+    notification = {
+        'issue_id': nodeid,
+        'title': issue.title,
+        'changes': changes,
+        'followups': followups,
+    }
 
     color = 'yellow'
     if db.status.get(issue.status, 'name') == 'solved':
@@ -138,11 +148,14 @@ def issueupdate(db, cl, nodeid, oldvalues):
     elif db.status.get(issue.status, 'name') == 'on hold':
         color = 'steelblue'
 
+    notification['color'] = color
+
     actor = db.user.get(issue.actor, 'username')
     actorname = db.user.get(issue.actor, 'realname')
+    actor = "{0} ({1})".format(actor, actorname)
 
     if issue.title != oldvalues['title']:
-        allmsg.append("title: {0} -> {1}".format(oldvalues['title'], issue.title))
+        changes['title'] = [oldvalues['title'], issue.title, actor]
 
     if issue.assignee != oldvalues['assignee']:
         if oldvalues['assignee']:
@@ -152,51 +165,48 @@ def issueupdate(db, cl, nodeid, oldvalues):
         else:
             old = 'None'
 
+        newuid = None
         if issue.assignee:
             newuid = db.user.get(issue.assignee, 'username')
             newname = db.user.get(issue.assignee, 'realname')
             new = "{0} ({1})".format(newuid, newname)
         else:
             new = 'None'
-        allmsg.append("{0} ({1}) changed assignee: {2} -> {3}".format(actor, actorname, old, new))
+        changes['assignee'] = [old, new, actor]
         # When changing assignee change the notification body and append a mention
-        body = "{0} assigned to @{1}".format(issue.title, newuid)
-    else:
-        body = issue.title
+        notification['mention'] = newuid
 
     if issue.status != oldvalues['status']:
         old = db.status.get(oldvalues['status'], 'name')
         new = db.status.get(issue.status, 'name')
-        allmsg.append("{0} ({1}) changed status: {2} -> {3}".format(actor, actorname, old, new))
+        changes['status'] = [old, new, actor]
     elif db.status.get(issue.status, 'name') in ['solved', 'invalid', 'wontfix']:
         try:
             uid = db.user.get(issue.assignee, 'username')
         except:
             uid = 'None'
-        body = ' @{0}: followup on closed issue "{1}" '.format(uid, issue.title)
+        notification['closed_followup'] = uid
 
     if issue.messages != oldvalues['messages']:
         msgid = issue.messages[-1]
         msg = db.msg.getnode(msgid)
         creator = db.user.get(msg.creator, 'username')
         creatorname = db.user.get(msg.creator, 'realname')
-        allmsg.append("followup message from {0} ({1})".format(creator, creatorname))
+        followups.append("{0} ({1})".format(creator, creatorname))
 
     if issue.topics != oldvalues['topics']:
         old = [db.topic.get(topicid, 'name') for topicid in oldvalues['topics']]
         new = [db.topic.get(topicid, 'name') for topicid in issue.topics]
-        allmsg.append("{0} ({1}) changed topics: {2} -> {3}".format(
-            actor, actorname, str.join(', ', old), str.join(', ', new)))
+        changes['topics'] = [str.join(', ', old), str.join(', ', new), actor]
 
     if issue.nosy != oldvalues['nosy']:
         old = [db.user.get(userid, 'username') for userid in oldvalues['nosy']]
         new = [db.user.get(userid, 'username') for userid in issue.nosy]
-        allmsg.append("{0} ({1}) changed subscribers: {2} -> {3}".format(
-            actor, actorname, str.join(', ', old), str.join(', ', new)))
+        changes['nosy'] = [str.join(', ', old), str.join(', ', new), actor]
 
     # Actually send notification, if needed.
-    if allmsg:
-        notify_rocket(db, nodeid, allmsg, color, body)
+    if not chatnotify.is_empty(notification):
+        notify_rocket(db, notification)
 
 
 def init(db):
@@ -25,7 +25,8 @@ __author__ = 'Antonio Messina <antonio.s.messina@gmail.com>'
 
 import re
 from roundup import roundupdb
-from roundup.mailer import Mailer
+
+from smtppool import PooledMailer
 
 re_forwarded = re.compile(
     r'Forwarding Incident (I-[0-9]+-[0-9]+) from TOPdesk@UZH:', re.I)
@@ -148,7 +149,7 @@ def topdesk_integration(db, cl, nodeid, oldvalues):
         }
 
         try:
-            mailer = Mailer(db.config)
+            mailer = PooledMailer(db.config)
             mailer.smtp_send([mail_to], mail_body, sender=mail_from)
             log.info("Sent reply to %s for issue %s (%s)." % (
                 mail_to, nodeid, topdesk_id))
@@ -21,6 +21,9 @@
 
 import re
 
+import addressindex
+import roleindex
+
 # regular expression thanks to: http://www.regular-expressions.info/email.html
 # this is the "99.99% solution for syntax only".
 email_regexp = (r"[a-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[a-z0-9!#$%&'*+/=?^_`{|}~-]+)*", r"(localhost|(?:[a-z0-9](?:[a-z0-9-]*[a-z0-9])?\.)+[a-z0-9](?:[a-z0-9-]*[a-z0-9]))")
@@ -87,10 +90,38 @@ def audit_user_fields(db, cl, nodeid, newvalues):
         except ValueError:
             raise ValueError, 'Timezone "%s" exceeds valid range [-23...23]' % tz
 
+def invalidate_roles(db, cl, nodeid, oldvalues):
+    ''' Forget the role index (see lib/roleindex.py) when a user is
+        created or its roles change.
+    '''
+    if oldvalues is None or oldvalues.get('roles') != cl.get(nodeid, 'roles'):
+        roleindex.get_index(db).changed()
+
+def index_addresses(db, cl, nodeid, oldvalues):
+    ''' Record in the address index (see lib/addressindex.py) the
+        addresses of the user, when the transaction is committed.
+    '''
+    if oldvalues is not None and 'address' in oldvalues and 'alternate_addresses' in oldvalues:
+        if (oldvalues['address'] == cl.get(nodeid, 'address') and
+                oldvalues['alternate_addresses'] == cl.get(nodeid, 'alternate_addresses')):
+            return
+    addressindex.pending(db).add(nodeid)
+    # if the index doesn't exist yet, it's built from the database at
+    # the first lookup
+    index = addressindex.get_index(db, build=False)
+    db.transactions.append((index.update, (nodeid, addressindex.entry(db, nodeid))))
+
 def init(db):
     # fire before changes are made
     db.user.audit('set', audit_user_fields)
     db.user.audit('create', audit_user_fields)
+    # fire after changes are made
+    db.user.react('set', invalidate_roles)
+    db.user.react('create', invalidate_roles)
+    db.user.react('create', index_addresses)
+    db.user.react('set', index_addresses)
+    db.user.react('retire', index_addresses)
+    db.user.react('restore', index_addresses)
 
 # vim: sts=4 sw=4 et si
 #SHA: a0bf5c895fded7afaec9c8c1b2b86d62fc325325
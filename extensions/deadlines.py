@@ -0,0 +1,15 @@
+# Templating utility counting the issues close to or past their
+# deadline for the sidebar, using the deadline index of
+# lib/deadlineindex.py instead of loading every open issue.
+
+import deadlineindex
+
+def deadline_counts(db, days=7):
+    """Return the number of open issues past their deadline, and of
+    the ones due in the next `days` days. `db` is the `db` variable
+    of the template."""
+    index = deadlineindex.get_index(db._db)
+    return len(index.overdue()), len(index.due_within(days))
+
+def init(instance):
+    instance.registerUtil('deadline_counts', deadline_counts)
@@ -52,13 +52,15 @@ __docformat__ = 'reStructuredText'
 __author__ = 'Antonio Messina <antonio.s.messina@gmail.com>'
 
 # From http://www.roundup-tracker.org/cgi-bin/moin.cgi/LDAPLogin2
-from ConfigParser import RawConfigParser, SafeConfigParser
 import logging
 import os
 import sys
 
 import ldap
 
+import authcache
+import ldapconfig
+import ldappool
 from roundup import password as PW
 from roundup.cgi import exceptions
 from roundup.cgi.actions import LoginAction
@@ -136,6 +138,13 @@ DEFAULT_VALS = {
     'bind_once' : False,
     # set to True if you want to autocreate user profiles
     'autocreate' : False,
+    # maximum number of connections bound as search_bind_dn kept open
+    # by each roundup process
+    'pool_size' : 4,
+    # seconds a successful LDAP login is remembered, so that logging in
+    # again with the same password does not query the LDAP server. 0
+    # disables the cache.
+    'auth_cache_ttl' : 0,
     }
 
 GC3_CONFIG_VALS = {'referrals' : 0,
@@ -175,26 +184,42 @@ class LDAPLoginAction(LoginAction):
         LoginAction.__init__(self, *args)
         self.set_values(DEFAULT_VALS)
         self.LOG = self.db.get_logger().getChild('ldap_auth')
-        ldap_conf_file = os.path.join(self.db.config.ext['HOME'],
-                                      'ldap_config.ini')
-        if os.path.exists(ldap_conf_file):
-            self.LOG.debug("Reading configuration file 'ldap_config.ini'")
-            cfg = RawConfigParser()
-            cfg.read(ldap_conf_file)
-            if cfg.has_section('ldap'):
-               for (key, value) in cfg.items('ldap'):
-                   self.LOG.debug("Setting option %s to %s" %(key, value))
-                   if key in ['use_local_auth', 'autocreate', 'bind_once']:
-                       setattr(self, key, cfg.getboolean('ldap', key))
-                   elif key in ['referrals', 'start_tls', 'timeout']:
-                       setattr(self, key, cfg.getint('ldap', key))
-                   elif key == 'debug' and cfg.getboolean('ldap', key):
-                       self.LOG.setLevel(logging.DEBUG)
-                   else:
-                       setattr(self, key, value)
-            else:
-               self.LOG.info("Skipping parsing of file ldap_config.ini as it has no 'ldap' section.")
-
+        cfg = ldapconfig.get_config(self.db.config.ext['HOME'], self.LOG)
+        if cfg is not None:
+            options = dict(cfg.options)
+            if options.pop('debug', False):
+                self.LOG.setLevel(logging.DEBUG)
+            self.set_values(options)
+
+
+    def ldap_connect(self, username, password):
+        """Open a new connection to the LDAP server, bound as `bind_dn`.
+        Returns None if TLS cannot be established."""
+        coding = self.coding
+        server = self.server_uri
+        self.LOG.debug("Trying to initialize %r." % server)
+        l = ldap.initialize(server)
+        self.LOG.debug("Connected to LDAP server %r." % server)
+
+        if self.start_tls and server.startswith('ldap:'):
+            self.LOG.debug("Trying to start TLS to %r." % server)
+            try:
+                l.start_tls_s()
+                self.LOG.debug("Using TLS to %r." % server)
+            except (ldap.SERVER_DOWN, ldap.CONNECT_ERROR), err:
+                self.LOG.warning("Couldn't establish TLS to %r (err: %s)." %\
+                                (server, str(err)))
+                return None
+
+        # you can use %(username)s and %(password)s here to get the
+        # stuff entered in the form:
+        binddn = self.bind_dn % locals()
+        bindpw = self.bind_pw % locals()
+        self.LOG.debug("Binding as %s" % (binddn.encode(coding)))
+        l.simple_bind_s(binddn.encode(coding),
+                        bindpw.encode(coding))
+        self.LOG.debug("Bound with binddn %r" % binddn)
+        return l
 
     def set_values(self, kw):
         for key, value in kw.items():
@@ -211,6 +236,10 @@ class LDAPLoginAction(LoginAction):
             self.LOG.debug(msg)
             self.client.error_message.append(msg)
             return LOGIN_FAILED
+
+        if self.auth_cache_ttl and self.cached_login(username, password):
+            return LOGIN_SUCCEDED
+
         try:
             try:
                 dn = None
@@ -237,34 +266,22 @@ class LDAPLoginAction(LoginAction):
                             ldap.set_option(option, value)
 
                 server = self.server_uri
-                self.LOG.debug("Trying to initialize %r." % server)
-                l = ldap.initialize(server)
-                self.LOG.debug("Connected to LDAP server %r." % server)
-
-                if self.start_tls and server.startswith('ldap:'):
-                    self.LOG.debug("Trying to start TLS to %r." % server)
-                    try:
-                        l.start_tls_s()
-                        self.LOG.debug("Using TLS to %r." % server)
-                    except (ldap.SERVER_DOWN, ldap.CONNECT_ERROR), err:
-                        self.LOG.warning("Couldn't establish TLS to %r (err: %s)." %\
-                                        (server, str(err)))
-                        return LOGIN_FAILED
-
-                # you can use %(username)s and %(password)s here to get the
-                # stuff entered in the form:
-                binddn = self.bind_dn % locals()
-                bindpw = self.bind_pw % locals()
-                self.LOG.debug("Binding as %s" % (binddn.encode(coding)))
-                l.simple_bind_s(binddn.encode(coding),
-                                bindpw.encode(coding))
-                self.LOG.debug("Bound with binddn %r" % binddn)
                 if self.search_bind_dn:
-                    self.LOG.debug("Binding as %s for searching attrs",
-                              binddn.encode(coding))
-                    l.simple_bind_s(self.search_bind_dn.encode(coding),
-                                   self.search_bind_pw.encode(coding))
-                    self.LOG.debug("Bound with binddn %r" % self.search_bind_dn)
+                    # Searches are done on a pooled connection, already
+                    # bound as `search_bind_dn`, and the password is
+                    # verified by rebinding the same connection.
+                    self.LOG.debug("Using pooled connection to %r." % server)
+                    l = ldappool.get_pool(server,
+                                          self.search_bind_dn.encode(coding),
+                                          self.search_bind_pw.encode(coding),
+                                          size=self.pool_size,
+                                          start_tls=self.start_tls,
+                                          timeout=self.timeout,
+                                          log=self.LOG)
+                else:
+                    l = self.ldap_connect(username, password)
+                    if l is None:
+                        return LOGIN_FAILED
 
                 # you can use %(username)s here to get the stuff entered in
                 # the form:
@@ -301,7 +318,9 @@ for %r." % (result_length, filterstr))
                     return LOGIN_FAILED
 
                 dn, ldap_dict = lusers[0]
-                if not self.bind_once:
+                # with a pooled connection, the user has not been bound
+                # yet even if `bind_once` is set.
+                if not self.bind_once or self.search_bind_dn:
                     self.LOG.debug("DN found is %r, trying to bind with pw" % dn)
                     l.simple_bind_s(dn, password.encode(coding))
                     self.LOG.debug("Bound with dn %r (username: %r)" % \
@@ -348,6 +367,9 @@ decode(coding)
                     msg = _("You do not have permission '%s' to login" % rights)
                     self.LOG.debug("%s, %s, %s", msg, self.client.user, rights)
                     raise exceptions.LoginError, msg
+                if self.auth_cache_ttl:
+                    authcache.get_cache(self.auth_cache_ttl, self.LOG).add(
+                        username, password)
                 return LOGIN_SUCCEDED
             except ldap.INVALID_CREDENTIALS, err:
                 self.LOG.debug("invalid credentials (wrong password?) for dn %r \
@@ -370,6 +392,27 @@ with next auth list entry." % (server, str(err)))
             self.LOG.exception("caught an exception, traceback follows...")
             return LOGIN_FAILED
 
+    def cached_login(self, username, password):
+        """Return True if `username` logged in via LDAP with the same
+        `password` less than `auth_cache_ttl` seconds ago, and is still
+        allowed to access the web interface."""
+        cache = authcache.get_cache(self.auth_cache_ttl, self.LOG)
+        if not cache.check(username, password):
+            return False
+        try:
+            self.client.userid = self.db.user.lookup(self.client.user)
+        except KeyError:
+            cache.invalidate(username)
+            return False
+        self.LOG.debug("Login succeded with cached LDAP authentication "
+                       "for user '%s'.", username)
+        rights = "Web Access"
+        if not self.hasPermission(rights):
+            msg = _("You do not have permission '%s' to login" % rights)
+            self.LOG.debug("%s, %s, %s", msg, self.client.user, rights)
+            raise exceptions.LoginError, msg
+        return True
+
     def local_user_exists(self):
         """Verify if the given user exists. As a side effect set the
         'client.userid'."""
@@ -416,6 +459,9 @@ with next auth list entry." % (server, str(err)))
             if authenticated:
                 self.LOG.debug("User '%s' authenticated against LDAP.",
                           username)
+            elif self.auth_cache_ttl:
+                authcache.get_cache(self.auth_cache_ttl, self.LOG).invalidate(
+                    username)
         if not authenticated:
             self.LOG.debug("Local database authentication")
             authenticated = self.local_login(password)
@@ -5,8 +5,11 @@
 #                                   ['codehilite', 'extra', 'nl2br'])
 
 import markdown2 as markdown_module
+import os
 import re
 
+from diskcache import DiskCache, get_cache, get_memcache
+
 
 # link_patterns = [
 #     (re.compile(r'\b(issue\d+)\b'), r'/help/\1'),
@@ -80,9 +83,23 @@ link_patterns = [
 
 
 
-def markdown(text):
+# Extras passed to markdown2. Changing them invalidates the cache.
+extras = ['footnotes', 'fenced-code-blocks', 'link-patterns']
+
+# Rendered messages are cached in memory and on disk, indexed by the
+# digest of the text, of the extras and of `link_patterns`.
+# Initialized by `init()`
+mem_cache = None
+disk_cache = None
+
+def patterns_fingerprint(patterns):
+  """Return a digest identifying the list of link `patterns`"""
+  return DiskCache.key(*[(regexp.pattern, regexp.flags, repl)
+                         for regexp, repl in patterns])
+
+def render(text):
   html = markdown_module.markdown(
-      text, extras=['footnotes', 'fenced-code-blocks', 'link-patterns', 'footnotes'],
+      text, extras=extras,
       link_patterns=link_patterns)
   # Ensure the code is converted to utf-8
   try:
@@ -90,5 +107,46 @@ def markdown(text):
   except UnicodeEncodeError:
     return html.encode('ascii', 'xmlcharrefreplace')
 
+def markdown(text):
+  key = DiskCache.key(markdown_module.__version__, ','.join(sorted(extras)),
+                      patterns_fingerprint(link_patterns), text)
+  html = mem_cache.get(key)
+  if html is None:
+    html = disk_cache.get(key)
+    if html is None:
+      html = render(text)
+      disk_cache.set(key, html)
+    mem_cache.set(key, html)
+  return html
+
+def markdown_messages(messages):
+  """Render the content of all the `messages` of an issue at once.
+
+  Returns a dictionary mapping message ids to the rendered content of
+  the messages the user is allowed to see."""
+  rendered = {}
+  for msg in messages:
+    if msg.content.is_view_ok():
+      rendered[msg.id] = markdown(msg.content.plain())
+  return rendered
+
 def init(instance):
+  # The size of the caches can be set in extensions/config.ini:
+  #
+  # [markdown]
+  # cache_size = 64     # on disk, in MB
+  # memcache_size = 512 # in memory, number of messages
+  global mem_cache, disk_cache
+  try:
+    max_size = int(instance.config.ext['MARKDOWN_CACHE_SIZE']) * 1024 * 1024
+  except (KeyError, ValueError):
+    max_size = 64 * 1024 * 1024
+  try:
+    maxlen = int(instance.config.ext['MARKDOWN_MEMCACHE_SIZE'])
+  except (KeyError, ValueError):
+    maxlen = 512
+  disk_cache = get_cache(
+    os.path.join(instance.config.DATABASE, 'cache', 'markdown'), max_size)
+  mem_cache = get_memcache('markdown', maxlen)
   instance.registerUtil('markdown', markdown)
+  instance.registerUtil('markdown_messages', markdown_messages)
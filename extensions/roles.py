@@ -0,0 +1,13 @@
+# Templating utility to look up the users having a role, using the
+# role index of lib/roleindex.py instead of loading the roles of every
+# user.
+
+import roleindex
+
+def users_with_role(db, role):
+    """Return the set of ids of the users having `role`. `db` is the
+    `db` variable of the template."""
+    return roleindex.get_index(db._db).users_with(role)
+
+def init(instance):
+    instance.registerUtil('users_with_role', users_with_role)
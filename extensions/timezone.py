@@ -2,6 +2,10 @@
 # a select-field that lists the available values.
 
 import cgi
+import json
+import threading
+
+from roundup.cgi.actions import Action
 
 try:
     import pytz
@@ -9,9 +13,43 @@ except ImportError:
     pytz = None
 
 
-def tzfield(prop, name, default):
+# The list of options is the same for every user, so it's built only
+# once: `options` is the html of all the options, not selected, and
+# `offsets` maps each zone to the (start, end) position of its option
+# in `options`.
+options = None
+offsets = None
+options_lock = threading.Lock()
+
+def build_options():
+    global options, offsets
+    with options_lock:
+        if options is not None:
+            return
+        l = []
+        o = {}
+        pos = 0
+        for zone in pytz.all_timezones:
+            z = cgi.escape(zone)
+            option = '<option  value="%s">%s</option>' % (z, z)
+            o[zone] = (pos, pos + len(option))
+            l.append(option)
+            pos += len(option) + 1
+        offsets = o
+        options = '\n'.join(l)
+
+def selected_option(zone):
+    z = cgi.escape(zone)
+    return '<option selected=selected value="%s">%s</option>' % (z, z)
+
+def tzfield(prop, name, default, compact=False):
+    """Return a <select> for the timezone property `prop`.
+
+    If `compact` is true, only the selected option is included: the
+    list of timezones is loaded by the browser from the `tzlist`
+    action when needed (see `static/user_utils.js`)."""
     if pytz:
-        value = prop.plain()        
+        value = prop.plain()
         if '' == value:
             value = default
         else:
@@ -20,19 +58,40 @@ def tzfield(prop, name, default):
             except ValueError:
                 pass
 
-        l = ['<select name="%s">' % name]
-        for zone in pytz.all_timezones:
-            s = ' '
-            if zone == value:
-                s = 'selected=selected '
-            z = cgi.escape(zone)
-            l.append('<option %svalue="%s">%s</option>' % (s, z, z))
-        l.append('</select>')
-        return '\n'.join(l)
-        
+        head = '<select name="%s">' % cgi.escape(name, True)
+        if compact:
+            head = '<select name="%s" class="tzselect">' % cgi.escape(name, True)
+            if value in pytz.all_timezones_set:
+                return '\n'.join([head, selected_option(value), '</select>'])
+            return '\n'.join([head, '</select>'])
+
+        if options is None:
+            build_options()
+        if value in offsets:
+            start, end = offsets[value]
+            body = options[:start] + selected_option(value) + options[end:]
+        else:
+            body = options
+        return '\n'.join([head, body, '</select>'])
+
     else:
         return prop.field()
 
+class TimezoneListAction(Action):
+    """Return the list of timezones as JSON.
+
+    If the `q` form variable is given, only the timezones containing
+    it (case insensitive) are returned."""
+    def handle(self):
+        zones = pytz and pytz.all_timezones or []
+        if self.form.has_key('q'):
+            q = self.form['q'].value.lower()
+            zones = [zone for zone in zones if q in zone.lower()]
+        self.client.additional_headers['Content-Type'] = 'application/json'
+        self.client.additional_headers['Cache-Control'] = 'max-age=86400'
+        return json.dumps(zones, separators=(',', ':'))
+
 def init(instance):
     instance.registerUtil('tzfield', tzfield)
+    instance.registerAction('tzlist', TimezoneListAction)
 #SHA: 8dbff4eb4997de47183bd5c49a3a11217b4a2994
@@ -1,14 +1,56 @@
-import subprocess
+import os
+
+from diskcache import get_cache
+from quotefold import fold
+
+# Bump this when `quotefold.fold()` changes its output, to invalidate
+# the cached entries.
+FOLD_VERSION = 'quotefold-1'
+
+# Folded message bodies, indexed by the digest of the message content.
+# Initialized by `init()`
+cache = None
+
+def fold_cached(text):
+    """Return `text` with quotes folded and signature removed, using the
+    render cache"""
+    key = cache.key(FOLD_VERSION, text)
+    output = cache.get(key)
+    if output is None:
+        output = fold(text)
+        cache.set(key, output)
+    return output
 
 def tprot(text):
-    """Convert using t-prot utility"""
+    """Fold quotes and strip signatures, like the t-prot utility"""
     try:
-        pipe = subprocess.Popen(['t-prot', '-t', '-s', '--body'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-        stdout, stderr = pipe.communicate(input=str(text))
-        text._value = stdout
+        text._value = fold_cached(str(text))
         return text.hyperlinked()
     except Exception as ex:
         return text.hyperlinked()
 
+def tprot_messages(messages):
+    """Render the content of all the `messages` of an issue at once.
+
+    Returns a dictionary mapping message ids to the rendered content
+    of the messages the user is allowed to see."""
+    rendered = {}
+    for msg in messages:
+        if msg.content.is_view_ok():
+            rendered[msg.id] = tprot(msg.content)
+    return rendered
+
 def init(instance):
+    # The size of the cache (in MB) can be set in extensions/config.ini:
+    #
+    # [tprot]
+    # cache_size = 64
+    global cache
+    try:
+        max_size = int(instance.config.ext['TPROT_CACHE_SIZE']) * 1024 * 1024
+    except (KeyError, ValueError):
+        max_size = 64 * 1024 * 1024
+    cache = get_cache(os.path.join(instance.config.DATABASE, 'cache', 'tprot'),
+                      max_size)
     instance.registerUtil('tprot', tprot)
+    instance.registerUtil('tprot_messages', tprot_messages)
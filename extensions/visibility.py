@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-#
+# @(#)visibility.py
+#
+#
+# Copyright (C) 2018, S3IT, University of Zurich. All rights reserved.
+#
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+__docformat__ = 'reStructuredText'
+
+# Lists of issues filtered with the set of visible issues of the user
+# (see lib/visibility.py), instead of checking the View permission of
+# every issue found: the `visible_batch` templating utility replaces
+# `request/batch` in issue.index.html, and the `export_csv` action
+# only exports the issues the user may view.
+
+import cgi
+import codecs
+import csv
+import re
+
+from roundup.cgi import actions, exceptions, templating
+
+import visibility
+
+
+def _filter_visible(db, userid, klass, matches, filterspec, sort, group):
+    itemids = klass.filter(matches, filterspec, sort, group)
+    visible = visibility.visible_issues(db, userid)
+    if visible is None:
+        return itemids
+    return [itemid for itemid in itemids if itemid in visible]
+
+
+def visible_batch(request):
+    """Same as `request/batch`, for the lists of issues."""
+    client = request.client
+    if request.classname != 'issue':
+        return request.batch()
+    if not client.db.security.hasPermission('Web Access', client.userid):
+        return templating.Batch(client, [], request.pagesize,
+                                request.startwith, classname='issue')
+
+    klass = client.db.getclass('issue')
+    if request.search_text:
+        matches = client.db.indexer.search(
+            [w.upper().encode("utf-8", "replace") for w in re.findall(
+                r'(?u)\b\w{2,25}\b',
+                unicode(request.search_text, "utf-8", "replace")
+            )], klass)
+    else:
+        matches = None
+
+    itemids = _filter_visible(client.db, client.userid, klass, matches,
+                              request.filterspec, request.sort, request.group)
+    return templating.Batch(client, itemids, request.pagesize,
+                            request.startwith, classname='issue')
+
+
+class ExportCSVAction(actions.ExportCSVAction):
+    """Export the issues of the current search the user may view,
+    instead of failing on the first one they may not."""
+
+    def handle(self):
+        request = templating.HTMLRequest(self.client)
+        if request.classname != 'issue':
+            return actions.ExportCSVAction.handle(self)
+        filterspec = request.filterspec
+        sort = request.sort
+        group = request.group
+        columns = request.columns
+        klass = self.db.getclass(request.classname)
+
+        # check if all columns exist on class
+        # the exception must be raised before sending header
+        props = klass.getprops()
+        for cname in columns:
+            if cname not in props:
+                self.client.response_code = 404
+                raise exceptions.SeriousError(
+                    self._('Column "%(column)s" not found on %(class)s')
+                    % {'column': cgi.escape(cname), 'class': request.classname})
+
+        # full-text search
+        if request.search_text:
+            matches = self.db.indexer.search(
+                re.findall(r'\b\w{2,25}\b', request.search_text), klass)
+        else:
+            matches = None
+
+        h = self.client.additional_headers
+        h['Content-Type'] = 'text/csv; charset=%s' % self.client.charset
+        # some browsers will honor the filename here...
+        h['Content-Disposition'] = 'inline; filename=query.csv'
+
+        self.client.header()
+
+        if self.client.env['REQUEST_METHOD'] == 'HEAD':
+            # all done, return a dummy string
+            return 'dummy'
+
+        wfile = self.client.request.wfile
+        if self.client.charset != self.client.STORAGE_CHARSET:
+            wfile = codecs.EncodedFile(wfile,
+                self.client.STORAGE_CHARSET, self.client.charset, 'replace')
+
+        writer = csv.writer(wfile)
+        self.client._socket_op(writer.writerow, columns)
+
+        # and search
+        for itemid in _filter_visible(self.db, self.userid, klass, matches,
+                                      filterspec, sort, group):
+            row = []
+            for name in columns:
+                # check permission to view this property on this item
+                if not self.hasPermission('View', itemid=itemid,
+                        classname=request.classname, property=name):
+                    raise exceptions.Unauthorised(self._(
+                        'You do not have permission to view %(class)s'
+                    ) % {'class': request.classname})
+                row.append(str(klass.get(itemid, name)))
+            self.client._socket_op(writer.writerow, row)
+
+        return '\n'
+
+
+def init(instance):
+    instance.registerUtil('visible_batch', visible_batch)
+    instance.registerAction('export_csv', ExportCSVAction)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-#
+#
+#
+# Copyright (C) 2018, S3IT, University of Zurich. All rights reserved.
+#
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""
+Index of the users owning each email address.
+
+The mail gateway finds the author of a message by looking at the
+address of every user, and then at their alternate addresses, which
+roundup can only search as substrings. The index maps every address,
+in lower case, to the users having it::
+
+    userids = lookup(db, 'John.Doe@example.com')
+
+Addresses are compared in lower case, as `db.user.stringFind()` does.
+
+The index is updated when a user is committed (see the reactors in
+`detectors/userauditor.py`). The users changed and not committed yet
+are remembered by the database handle, and looked up in the database
+instead, so that a user created while handling a message is found by
+the next lookup. It's stored in the
+`cache/addresses` file of the database, shared by all the roundup
+processes of the tracker, and rebuilt from the database when the
+file is missing.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import errno
+import fcntl
+import json
+import os
+import threading
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(db, build=True):
+    """Return the process-wide `AddressIndex` of the tracker of `db`,
+    building it first if needed and `build` is True."""
+    path = os.path.abspath(os.path.join(db.config.DATABASE, 'cache',
+                                        'addresses'))
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = AddressIndex(path)
+        index = _indexes[path]
+    if build and not os.path.exists(path):
+        index.rebuild(db)
+    return index
+
+
+def entry(db, userid):
+    """Return the `[address, [alternate addresses]]` of user `userid`
+    to store in the index, or None if it doesn't belong there."""
+    if db.user.is_retired(userid):
+        return None
+    address = db.user.get(userid, 'address')
+    alternates = []
+    if 'alternate_addresses' in db.user.getprops():
+        for alternate in (db.user.get(userid, 'alternate_addresses')
+                          or '').split('\n'):
+            alternate = alternate.strip().lower()
+            if alternate:
+                alternates.append(alternate)
+    if not address and not alternates:
+        return None
+    return [address and address.lower(), alternates]
+
+
+def pending(db):
+    """Return the set of ids of the users changed by `db` and not
+    committed yet."""
+    changed = getattr(db, 'address_index_pending', None)
+    if changed is None:
+        changed = db.address_index_pending = set()
+        db.registerClearCacheCallback(set.clear, changed)
+    return changed
+
+
+def lookup(db, address):
+    """Return the ids of the users with primary address `address` or,
+    if there are none, of the ones having it among their alternate
+    addresses, lowest first."""
+    address = address.lower()
+    primary, alternate = get_index(db).users(address)
+    for userid in pending(db):
+        primary.discard(userid)
+        alternate.discard(userid)
+        # the anydbm backend doesn't tell about rollbacks: read the
+        # current addresses, the user may even be gone
+        if not db.user.hasnode(userid):
+            continue
+        value = entry(db, userid)
+        if value is None:
+            continue
+        if value[0] == address:
+            primary.add(userid)
+        elif address in value[1]:
+            alternate.add(userid)
+    return sorted(primary or alternate, key=int)
+
+
+class AddressIndex(object):
+    """Map the addresses to the users, stored in file `path` as a JSON
+    dictionary `{userid: [address, [alternate addresses]]}`."""
+
+    def __init__(self, path):
+        self.path = path
+        self._mtime = None
+        self._addresses = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        # read the file again only if another process changed it
+        try:
+            st = os.stat(self.path)
+            # the file is replaced at every update
+            mtime = (st.st_ino, st.st_mtime)
+        except OSError:
+            mtime = None
+        with self._lock:
+            if mtime == self._mtime:
+                return self._addresses
+            try:
+                with open(self.path) as fd:
+                    entries = json.load(fd)
+            except (IOError, ValueError):
+                entries = {}
+            addresses = {}
+            for userid, (address, alternates) in entries.items():
+                userid = str(userid)
+                if address:
+                    addresses.setdefault(address, ([], []))[0].append(userid)
+                for alternate in alternates:
+                    addresses.setdefault(alternate, ([], []))[1].append(userid)
+            self._addresses = addresses
+            self._mtime = mtime
+            return self._addresses
+
+    def users(self, address):
+        """Return the sets of ids of the users having `address`, in
+        lower case, as their primary address and as an alternate
+        one."""
+        primary, alternate = self._load().get(address, ((), ()))
+        return set(primary), set(alternate)
+
+    def _write(self, entries):
+        tmpname = self.path + '.tmp'
+        with open(tmpname, 'w') as fd:
+            json.dump(entries, fd)
+        os.rename(tmpname, self.path)
+
+    def _locked(self):
+        try:
+            os.makedirs(os.path.dirname(self.path))
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+        lock = open(self.path + '.lock', 'a')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def update(self, userid, value):
+        """Store `value`, as returned by `entry()`, for user `userid`;
+        remove the user if `value` is None. Nothing is done if the
+        index wasn't built yet."""
+        lock = self._locked()
+        try:
+            try:
+                with open(self.path) as fd:
+                    entries = json.load(fd)
+            except IOError as ex:
+                if ex.errno == errno.ENOENT:
+                    return
+                raise
+            except ValueError:
+                entries = {}
+            if value is None:
+                if entries.pop(userid, None) is None:
+                    return
+            else:
+                entries[userid] = value
+            self._write(entries)
+        finally:
+            lock.close()
+
+    def rebuild(self, db):
+        """Replace the content of the index with the addresses of the
+        users of `db`. Return the number of users indexed."""
+        entries = {}
+        for userid in db.user.getnodeids(retired=False):
+            value = entry(db, userid)
+            if value is not None:
+                entries[userid] = value
+        lock = self._locked()
+        try:
+            self._write(entries)
+        finally:
+            lock.close()
+        return len(entries)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-#
+#
+#
+# Copyright (C) 2018, S3IT, University of Zurich. All rights reserved.
+#
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""
+Short-lived, in-memory cache of successful LDAP logins.
+
+The cache maps a username to a salted PBKDF2 hash of the password
+that was last accepted by the LDAP server, and to the time the entry
+expires. Passwords are never stored in clear, and the salt is
+generated randomly when the process starts, so the hashes are
+useless outside of it.
+
+The cache is process-wide::
+
+    cache = get_cache(ttl=300)
+    if cache.check(username, password):
+        ...  # skip LDAP
+"""
+
+__docformat__ = 'reStructuredText'
+
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+
+# PBKDF2 iterations used to hash the passwords
+ITERATIONS = 10000
+
+# Log the counters every `STATS_INTERVAL` lookups
+STATS_INTERVAL = 100
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache(ttl, log=None):
+    """Return the process-wide `AuthCache`, updating its `ttl`."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AuthCache(ttl, log)
+        _cache.ttl = ttl
+        return _cache
+
+
+class AuthCache(object):
+    """Remember successful logins for `ttl` seconds."""
+
+    def __init__(self, ttl, log=None):
+        self.ttl = ttl
+        self.log = log or logging.getLogger('roundup.authcache')
+        self.hits = 0
+        self.misses = 0
+        self._salt = os.urandom(16)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _hash(self, username, password):
+        if isinstance(password, unicode):
+            password = password.encode('utf-8')
+        if isinstance(username, unicode):
+            username = username.encode('utf-8')
+        return hashlib.pbkdf2_hmac('sha256', password,
+                                   self._salt + username, ITERATIONS)
+
+    def check(self, username, password):
+        """Return True if `username` logged in with `password` less than
+        `ttl` seconds ago."""
+        with self._lock:
+            entry = self._entries.get(username)
+        valid = False
+        if entry is not None:
+            digest, expires = entry
+            valid = (time.time() < expires and
+                     hmac.compare_digest(digest, self._hash(username, password)))
+        if valid:
+            self.hits += 1
+        else:
+            self.misses += 1
+        if (self.hits + self.misses) % STATS_INTERVAL == 0:
+            self.log_stats()
+        return valid
+
+    def add(self, username, password):
+        """Remember that `username` logged in with `password`."""
+        digest = self._hash(username, password)
+        now = time.time()
+        with self._lock:
+            self._entries[username] = (digest, now + self.ttl)
+            if len(self._entries) % STATS_INTERVAL == 0:
+                # drop expired entries
+                for name, (d, expires) in self._entries.items():
+                    if expires <= now:
+                        del self._entries[name]
+
+    def invalidate(self, username):
+        """Forget the cached login of `username`."""
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._entries),
+            'hit_rate': lookups and float(self.hits) / lookups or 0.0,
+        }
+
+    def log_stats(self):
+        self.log.info("LDAP login cache: %(entries)d entries, %(hits)d hits, "
+                      "%(misses)d misses (hit rate %(hit_rate).2f)", self.stats())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-#
+#
+#
+# Copyright (C) 2018, S3IT, University of Zurich. All rights reserved.
+#
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""
+Minimal Rocket.Chat REST client, keeping a logged in session.
+
+The client logs in the first time a message is posted, and keeps
+using the same authentication token (and the same keep-alive HTTP
+connection) for the following messages. If the server answers with
+401 the token has expired: the client logs in again and retries::
+
+    client = get_client(base_url, user, password, timeout=10)
+    client.post_message({'channel': '#roundup', 'text': 'Hello'})
+"""
+
+__docformat__ = 'reStructuredText'
+
+import json
+import logging
+import threading
+
+import requests
+
+DEFAULT_TIMEOUT = 10
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url, user, password, timeout=DEFAULT_TIMEOUT, log=None):
+    """Return the process-wide `RocketChatClient` for `user` on
+    `base_url`."""
+    with _clients_lock:
+        key = (base_url, user)
+        if key not in _clients:
+            _clients[key] = RocketChatClient(base_url, user, password,
+                                             timeout, log)
+        client = _clients[key]
+        # the configuration may have been changed
+        client.password = password
+        client.timeout = timeout
+        return client
+
+
+class RocketChatError(Exception):
+    pass
+
+
+class RocketChatClient(object):
+    """Post messages on a Rocket.Chat server as `user`."""
+
+    def __init__(self, base_url, user, password, timeout=DEFAULT_TIMEOUT,
+                 log=None):
+        self.base_url = base_url.rstrip('/')
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        self.log = log or logging.getLogger('roundup.chatclient')
+
+        self.session = requests.Session()
+        self.session.headers['Content-Type'] = 'application/json'
+        self._auth = None
+        self._lock = threading.Lock()
+
+    def _uri(self, method):
+        return "{0}/api/v1/{1}".format(self.base_url, method)
+
+    def login(self):
+        """Log in and store the authentication token in the session."""
+        login_uri = self._uri('login')
+        response = self.session.post(login_uri, timeout=self.timeout,
+                                     data=json.dumps({"username": self.user,
+                                                      "password": self.password}))
+        if response.status_code != 200:
+            raise RocketChatError("failed to login to {0} ({1}): {2}".format(
+                login_uri, response.status_code, response.text))
+        data = response.json()
+        if data.get("status") != "success":
+            raise RocketChatError("failed to login on {0}: {1}".format(
+                self.base_url, data))
+        self.log.debug("successfully logged in on {0}".format(self.base_url))
+        self._auth = {"X-Auth-Token": data["data"]["authToken"],
+                      "X-User-Id": data["data"]["userId"]}
+
+    def _post(self, method, data):
+        with self._lock:
+            if self._auth is None:
+                self.login()
+            auth = self._auth
+        response = self.session.post(self._uri(method), headers=auth,
+                                     data=json.dumps(data), timeout=self.timeout)
+        if response.status_code == 401:
+            self.log.debug("authentication token expired, logging in again")
+            with self._lock:
+                if self._auth is auth:
+                    self.login()
+                auth = self._auth
+            response = self.session.post(self._uri(method), headers=auth,
+                                         data=json.dumps(data),
+                                         timeout=self.timeout)
+        return response
+
+    def post_message(self, data):
+        """Send the message `data` with `chat.postMessage`."""
+        post_message_uri = self._uri('chat.postMessage')
+        response = self._post('chat.postMessage', data)
+        if response.status_code != 200:
+            raise RocketChatError("failed to post issue to {0} ({1}): {2}".format(
+                post_message_uri, response.status_code, response.text))
+        result = response.json()
+        if not result.get("success"):
+            raise RocketChatError("failed send message to {0} ({1}): {2}".format(
+                self.base_url, data.get("channel"), result))
+        self.log.debug("successfully sent message {0} to {1} ({2})".format(
+            result, self.base_url, data.get("channel")))
+        return result
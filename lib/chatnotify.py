@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-#
+#
+#
+# Copyright (C) 2018, S3IT, University of Zurich. All rights reserved.
+#
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""
+Chat notifications about an issue, and how to merge them.
+
+A notification is a dictionary describing what happened to an issue,
+built by the `rocketchat` detector:
+
+`issue_id`, `title`, `color`
+    the issue, its current title and the color of the message;
+`creator`
+    the username of the creator, if the issue was just created;
+`changes`
+    maps the name of each property changed to `[old, new, actor]`,
+    where `old` and `new` are already formatted for display;
+`followups`
+    "username (realname)" of the authors of new messages;
+`mention`
+    the username of the new assignee;
+`closed_followup`
+    the username of the assignee, if a message was added to a
+    closed issue.
+
+`merge()` combines the notifications about the same issue into one,
+keeping the first old value and the last new value of each property,
+and `render()` returns the text of the `chat.postMessage` call.
+"""
+
+__docformat__ = 'reStructuredText'
+
+# order of the lines in the message; followups go after the status
+CHANGES = [
+    ('title', u"title: {1} -> {2}"),
+    ('assignee', u"{0} changed assignee: {1} -> {2}"),
+    ('status', u"{0} changed status: {1} -> {2}"),
+    ('followups', None),
+    ('topics', u"{0} changed topics: {1} -> {2}"),
+    ('nosy', u"{0} changed subscribers: {1} -> {2}"),
+]
+
+
+def _decode(value):
+    if isinstance(value, str):
+        return value.decode('utf-8', 'replace')
+    if isinstance(value, (list, tuple)):
+        return [_decode(v) for v in value]
+    if isinstance(value, dict):
+        return dict((k, _decode(v)) for k, v in value.items())
+    return value
+
+
+def merge(notifications):
+    """Return a notification with the changes of all the
+    `notifications` about the same issue, oldest first."""
+    merged = {'changes': {}, 'followups': []}
+    for n in notifications:
+        for key in ('issue_id', 'title', 'color', 'closed_followup'):
+            merged[key] = n.get(key)
+        if n.get('creator') and not merged.get('creator'):
+            merged['creator'] = n['creator']
+        for field, (old, new, actor) in n.get('changes', {}).items():
+            if field in merged['changes']:
+                old = merged['changes'][field][0]
+            merged['changes'][field] = [old, new, actor]
+            if field == 'assignee':
+                merged['mention'] = n.get('mention')
+        merged['followups'].extend(n.get('followups', []))
+
+    # properties changed back to their original value
+    for field, (old, new, actor) in merged['changes'].items():
+        if old == new:
+            del merged['changes'][field]
+    if 'assignee' not in merged['changes']:
+        merged.pop('mention', None)
+    if 'status' in merged['changes']:
+        merged['closed_followup'] = None
+    return merged
+
+
+def is_empty(notification):
+    """Return True if there is nothing to say in `notification`."""
+    return not (notification.get('creator') or notification.get('changes')
+                or notification.get('followups'))
+
+
+def render(notification):
+    """Return `(msgs, color, body)` for `notification`."""
+    n = _decode(notification)
+    msgs = []
+    if n.get('creator'):
+        msgs.append(u"NEW issue{0} has been created by {1}".format(
+            n['issue_id'], n['creator']))
+    changes = n.get('changes', {})
+    for field, fmt in CHANGES:
+        if field == 'followups':
+            for author in n.get('followups', []):
+                msgs.append(u"followup message from {0}".format(author))
+        elif field in changes:
+            old, new, actor = changes[field]
+            msgs.append(fmt.format(actor, old, new))
+
+    body = n['title']
+    if 'assignee' in changes and n.get('mention'):
+        body = u"{0} assigned to @{1}".format(n['title'], n['mention'])
+    if n.get('closed_followup'):
+        body = u' @{0}: followup on closed issue "{1}" '.format(
+            n['closed_followup'], n['title'])
+    return msgs, n['color'], body
+
+
+def post_message_data(notification, tracker_web, room_id, channel):
+    """Return the data of the `chat.postMessage` call for
+    `notification`."""
+    msgs, color, body = render(notification)
+    return {
+        "roomId": room_id,
+        "channel": channel,
+        "text": u"{0}issue{1} *{2}*".format(_decode(tracker_web),
+                                            notification['issue_id'], body),
+        "attachments": [{
+            "text": u"\n".join(msgs),
+            "color": color
+        }]
+    }
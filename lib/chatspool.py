@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-#
+#
+#
+# Copyright (C) 2018, S3IT, University of Zurich. All rights reserved.
+#
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""
+On-disk queue of the notifications waiting to be delivered.
+
+The `rocketchat` detector writes every notification in the spool
+directory, one JSON file per notification, and returns immediately.
+The `roundup-chatspool` script delivers them: a notification which
+can't be sent is retried later, waiting twice as long after every
+failure, and moved to the `failed` subdirectory after `MAX_ATTEMPTS`
+attempts::
+
+    spool = Spool(os.path.join(db.config.DATABASE, 'chatspool'))
+    spool.enqueue({'issue_id': '42', 'data': {...}})
+    ...
+    spool.deliver(lambda entry: client.post_message(entry['data']))
+
+The mail outbox (see `outbox.py`) is a spool too.
+
+Entries can carry a `key`: when a merge function is passed to
+`deliver()`, all the entries with the same key are merged into one
+before being sent.
+
+Files are written to a temporary name and renamed in place, so a
+reader never sees a partial entry. Only one process at a time can run
+`deliver()`.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import errno
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+# delay before the first retry, in seconds; doubled after each failure
+BASE_DELAY = 30
+
+# maximum delay between two attempts, in seconds
+MAX_DELAY = 3600
+
+# entries which failed this many times are moved to `failed/`
+MAX_ATTEMPTS = 20
+
+
+class Spool(object):
+    """Queue of notifications stored in directory `path`."""
+
+    def __init__(self, path, log=None):
+        self.path = path
+        self.failed_path = os.path.join(path, 'failed')
+        self.log = log or logging.getLogger('roundup.chatspool')
+        # number of entries merged with an older one by `deliver()`
+        self.coalesced = 0
+        self._pool = None
+
+    def _makedirs(self, path):
+        try:
+            os.makedirs(path)
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+
+    def _write(self, fname, entry):
+        fd, tmpname = tempfile.mkstemp(dir=self.path, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                json.dump(entry, tmp)
+            os.rename(tmpname, fname)
+        except:
+            try:
+                os.remove(tmpname)
+            except OSError:
+                pass
+            raise
+
+    def enqueue(self, entry):
+        """Add the notification `entry`, a dictionary, to the spool."""
+        self._makedirs(self.path)
+        now = time.time()
+        entry = dict(entry, created=now, attempts=0, next_attempt=now)
+        # names sort in order of creation
+        fname = os.path.join(self.path, '%017.6f-%d-%s.json' % (
+            now, os.getpid(), os.urandom(4).encode('hex')))
+        self._write(fname, entry)
+
+    def entries(self):
+        """Return the file names of the queued entries, oldest first."""
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return []
+        return [os.path.join(self.path, name) for name in sorted(names)
+                if name.endswith('.json') and not name.startswith('.')]
+
+    def load(self, fname):
+        """Return the entry stored in `fname`, or None if it's gone."""
+        try:
+            with open(fname, 'rb') as fd:
+                return json.load(fd)
+        except IOError:
+            return None
+
+    def _retry(self, fname, entry, error):
+        entry['attempts'] += 1
+        entry['last_error'] = str(error)
+        if entry['attempts'] >= MAX_ATTEMPTS:
+            self.log.error("Giving up notification %s after %d attempts: %s",
+                           os.path.basename(fname), entry['attempts'], error)
+            self._makedirs(self.failed_path)
+            self._write(fname, entry)
+            os.rename(fname, os.path.join(self.failed_path,
+                                          os.path.basename(fname)))
+            return
+        delay = min(BASE_DELAY * 2 ** (entry['attempts'] - 1), MAX_DELAY)
+        entry['next_attempt'] = time.time() + delay
+        self.log.warning("Unable to deliver notification %s (attempt %d), "
+                         "retrying in %ds: %s", os.path.basename(fname),
+                         entry['attempts'], delay, error)
+        self._write(fname, entry)
+
+    def deliver(self, send, window=0, merge=None, workers=1):
+        """Call `send(entry)` for each entry which is due, removing it
+        from the spool if no exception is raised. If `workers` is
+        greater than 1, `send()` is called in that many threads.
+
+        If `merge` is given, all the queued entries with the same
+        `key` are replaced by `merge(entries)` before being sent, and
+        an entry is only due `window` seconds after it was queued, to
+        give time to the following changes to arrive.
+
+        Return the number of entries delivered, or None if another
+        process is already delivering.
+        """
+        self._makedirs(self.path)
+        lock = open(os.path.join(self.path, '.lock'), 'a')
+        try:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                return None
+            groups = OrderedDict()
+            for fname in self.entries():
+                entry = self.load(fname)
+                if entry is None:
+                    continue
+                key = merge is not None and entry.get('key') or fname
+                groups.setdefault(key, []).append((fname, entry))
+
+            now = time.time()
+            due = []
+            for items in groups.values():
+                fname, entry = items[0]
+                if entry['next_attempt'] > now:
+                    continue
+                if merge is not None and entry['created'] + window > now:
+                    continue
+                if len(items) > 1:
+                    entry = merge([e for f, e in items])
+                    self._write(fname, entry)
+                    for f, e in items[1:]:
+                        os.remove(f)
+                    self.coalesced += len(items) - 1
+                due.append((fname, entry))
+
+            def process(item):
+                fname, entry = item
+                try:
+                    send(entry)
+                except Exception as ex:
+                    self._retry(fname, entry, ex)
+                    return 0
+                os.remove(fname)
+                return 1
+
+            if workers > 1 and len(due) > 1:
+                if self._pool is None:
+                    self._pool = ThreadPool(workers)
+                return sum(self._pool.map(process, due))
+            return sum(map(process, due))
+        finally:
+            lock.close()
+
+    def failed_entries(self):
+        """Return the file names of the entries given up, oldest first."""
+        try:
+            names = os.listdir(self.failed_path)
+        except OSError:
+            return []
+        return [os.path.join(self.failed_path, name) for name in sorted(names)
+                if name.endswith('.json') and not name.startswith('.')]
+
+    def replay(self, fname):
+        """Put the failed entry `fname` back in the queue."""
+        entry = self.load(fname)
+        if entry is None:
+            return
+        entry['attempts'] = 0
+        entry['next_attempt'] = time.time()
+        self._write(fname, entry)
+        os.rename(fname, os.path.join(self.path, os.path.basename(fname)))
+
+    def stats(self):
+        """Return the number of queued, due and failed entries, and the
+        age in seconds of the oldest queued one."""
+        now = time.time()
+        queued = due = 0
+        oldest = None
+        for fname in self.entries():
+            entry = self.load(fname)
+            if entry is None:
+                continue
+            queued += 1
+            if entry['next_attempt'] <= now:
+                due += 1
+            if oldest is None or entry['created'] < oldest:
+                oldest = entry['created']
+        failed = len(self.failed_entries())
+        return {
+            'queued': queued,
+            'due': due,
+            'failed': failed,
+            'oldest_age': oldest is not None and now - oldest or 0,
+        }
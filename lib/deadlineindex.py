@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-#
+#
+#
+# Copyright (C) 2018, S3IT, University of Zurich. All rights reserved.
+#
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""
+Index of the deadlines of the open issues, sorted by date.
+
+Finding the issues close to or past their deadline means loading every
+open issue. The index keeps the deadline and the status of the open
+issues which have one, and answers range queries with a binary
+search::
+
+    index = get_index(db)
+    overdue = index.overdue()
+    due_soon = index.due_within(7)
+
+The index is updated when an issue is committed (see the reactors in
+`detectors/deadlineindex.py`). It's stored in the `cache/deadlines`
+file of the database, shared by all the roundup processes of the
+tracker, and rebuilt from the database when the file is missing.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import bisect
+import errno
+import fcntl
+import json
+import os
+import threading
+import time
+
+# issues not closed, same as `issue_status_notclosed` in page.html:
+# no status, new, in progress, pending, on hold
+OPEN_STATUSES = (None, '1', '2', '5', '7')
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(db, build=True):
+    """Return the process-wide `DeadlineIndex` of the tracker of `db`,
+    building it first if needed and `build` is True."""
+    path = os.path.abspath(os.path.join(db.config.DATABASE, 'cache',
+                                        'deadlines'))
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = DeadlineIndex(path)
+        index = _indexes[path]
+    if build and not os.path.exists(path):
+        index.rebuild(db)
+    return index
+
+
+def entry(db, issueid):
+    """Return the `(timestamp, status)` of issue `issueid` to store in
+    the index, or None if it doesn't belong there."""
+    if db.issue.is_retired(issueid):
+        return None
+    deadline = db.issue.get(issueid, 'deadline')
+    status = db.issue.get(issueid, 'status')
+    if deadline is None or status not in OPEN_STATUSES:
+        return None
+    return (deadline.timestamp(), status)
+
+
+def _timestamp(date):
+    if date is None:
+        return None
+    if isinstance(date, (int, long, float)):
+        return date
+    return date.timestamp()
+
+
+class DeadlineIndex(object):
+    """Map the open issues to their deadline, stored in file `path` as
+    a JSON dictionary `{issueid: [timestamp, status]}`."""
+
+    def __init__(self, path):
+        self.path = path
+        self._mtime = None
+        self._sorted = []
+        self._lock = threading.Lock()
+
+    def _load(self):
+        # read the file again only if another process changed it
+        try:
+            st = os.stat(self.path)
+            # the file is replaced at every update
+            mtime = (st.st_ino, st.st_mtime)
+        except OSError:
+            mtime = None
+        with self._lock:
+            if mtime == self._mtime:
+                return self._sorted
+            try:
+                with open(self.path) as fd:
+                    entries = json.load(fd)
+            except (IOError, ValueError):
+                entries = {}
+            self._sorted = sorted((timestamp, int(issueid), status)
+                                  for issueid, (timestamp, status)
+                                  in entries.items())
+            self._mtime = mtime
+            return self._sorted
+
+    def _write(self, entries):
+        tmpname = self.path + '.tmp'
+        with open(tmpname, 'w') as fd:
+            json.dump(entries, fd)
+        os.rename(tmpname, self.path)
+
+    def _locked(self):
+        try:
+            os.makedirs(os.path.dirname(self.path))
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+        lock = open(self.path + '.lock', 'a')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def update(self, issueid, value):
+        """Store `value`, as returned by `entry()`, for issue
+        `issueid`; remove the issue if `value` is None. Nothing is done
+        if the index wasn't built yet."""
+        lock = self._locked()
+        try:
+            try:
+                with open(self.path) as fd:
+                    entries = json.load(fd)
+            except IOError as ex:
+                if ex.errno == errno.ENOENT:
+                    return
+                raise
+            except ValueError:
+                entries = {}
+            if value is None:
+                if entries.pop(issueid, None) is None:
+                    return
+            else:
+                entries[issueid] = list(value)
+            self._write(entries)
+        finally:
+            lock.close()
+
+    def rebuild(self, db):
+        """Replace the content of the index with the open issues of
+        `db` which have a deadline. Return their number."""
+        entries = {}
+        spec = {'status': [status or '-1' for status in OPEN_STATUSES]}
+        for issueid in db.issue.filter(None, spec):
+            value = entry(db, issueid)
+            if value is not None:
+                entries[issueid] = list(value)
+        lock = self._locked()
+        try:
+            self._write(entries)
+        finally:
+            lock.close()
+        return len(entries)
+
+    def between(self, start=None, end=None, statuses=None):
+        """Return the ids of the issues with a deadline from `start`
+        (included) to `end` (excluded), earliest first. Both are dates
+        or timestamps, and None means no limit. If `statuses` is given,
+        only the issues with one of these statuses are returned."""
+        index = self._load()
+        lo = 0
+        if start is not None:
+            lo = bisect.bisect_left(index, (_timestamp(start),))
+        hi = len(index)
+        if end is not None:
+            hi = bisect.bisect_left(index, (_timestamp(end),))
+        return [str(issueid) for timestamp, issueid, status in index[lo:hi]
+                if statuses is None or status in statuses]
+
+    def overdue(self, now=None, statuses=None):
+        """Return the ids of the issues past their deadline."""
+        return self.between(None, now or time.time(), statuses)
+
+    def due_within(self, days, now=None, statuses=None):
+        """Return the ids of the issues with a deadline in the next
+        `days` days."""
+        now = _timestamp(now) or time.time()
+        return self.between(now, now + days * 24 * 3600, statuses)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-#
+#
+#
+# Copyright (C) 2018, S3IT, University of Zurich. All rights reserved.
+#
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""
+Content-addressed cache for rendered text, stored on disk.
+
+Every entry is a file named after the digest of its key, under
+`<path>/<first two hex digits>/<digest>`.  Files are written to a
+temporary name and renamed in place, so that several roundup
+processes (web server, mailgw, cron scripts) can share the same cache
+directory without locking on reads.
+
+The cache is bounded in size: the modification time of an entry is
+bumped every time it is read, and when the total size of the
+directory exceeds `max_size` the least recently used entries are
+removed.
+
+`LRUCache` is a small in-memory cache which can be put in front of a
+`DiskCache` to avoid reading the same files over and over.
+
+Caches are process-wide objects, use `get_cache()` to obtain one::
+
+    cache = get_cache(os.path.join(db.config.DATABASE, 'cache', 'tprot'))
+    key = cache.key(text)
+    html = cache.get(key)
+    if html is None:
+        html = render(text)
+        cache.set(key, html)
+"""
+
+__docformat__ = 'reStructuredText'
+
+import errno
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# default size of a cache directory: 64MB
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+# the size of the cache directory is checked every `SWEEP_INTERVAL`
+# writes, rather than at every write.
+SWEEP_INTERVAL = 64
+
+# when the cache is full, remove entries until it's below this
+# fraction of `max_size`
+SWEEP_TARGET = 0.9
+
+_caches = {}
+_memcaches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(path, max_size=DEFAULT_MAX_SIZE):
+    """Return the process-wide `DiskCache` stored in `path`."""
+    path = os.path.abspath(path)
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = DiskCache(path, max_size)
+        return _caches[path]
+
+
+def get_memcache(name, maxlen=1024):
+    """Return the process-wide `LRUCache` called `name`."""
+    with _caches_lock:
+        if name not in _memcaches:
+            _memcaches[name] = LRUCache(maxlen)
+        return _memcaches[name]
+
+
+class DiskCache(object):
+    """Size-bounded LRU cache of strings, stored in directory `path`."""
+
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(*parts):
+        """Return the digest of `parts`, to be used as a cache key."""
+        digest = hashlib.sha1()
+        for part in parts:
+            if isinstance(part, unicode):
+                part = part.encode('utf-8')
+            digest.update(str(part))
+            digest.update('\0')
+        return digest.hexdigest()
+
+    def _filename(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key):
+        """Return the value stored for `key`, or None."""
+        fname = self._filename(key)
+        try:
+            with open(fname, 'rb') as fd:
+                value = fd.read()
+            # mark the entry as recently used
+            os.utime(fname, None)
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Store `value` for `key`. Errors are silently ignored."""
+        fname = self._filename(key)
+        dirname = os.path.dirname(fname)
+        try:
+            try:
+                os.makedirs(dirname)
+            except OSError as ex:
+                if ex.errno != errno.EEXIST:
+                    raise
+            fd, tmpname = tempfile.mkstemp(dir=dirname, prefix='.tmp')
+        except (IOError, OSError):
+            return
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(value)
+            os.rename(tmpname, fname)
+        except (IOError, OSError):
+            try:
+                os.remove(tmpname)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._writes += 1
+            sweep = self._writes % SWEEP_INTERVAL == 0
+        if sweep:
+            self.sweep()
+
+    def sweep(self):
+        """Remove the least recently used entries if the cache is full.
+
+        Only one process at a time sweeps the cache directory; if
+        another one is already doing it, return immediately.
+        """
+        try:
+            lock = open(os.path.join(self.path, '.lock'), 'a')
+        except IOError:
+            return
+        try:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                return
+            entries = []
+            total = 0
+            for dirpath, dirnames, filenames in os.walk(self.path):
+                for name in filenames:
+                    if name.startswith('.'):
+                        continue
+                    fname = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(fname)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, fname))
+                    total += st.st_size
+            if total <= self.max_size:
+                return
+            entries.sort()
+            target = self.max_size * SWEEP_TARGET
+            for mtime, size, fname in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(fname)
+                except OSError:
+                    continue
+                total -= size
+                self.evictions += 1
+        finally:
+            lock.close()
+
+    def stats(self):
+        """Return a dictionary with the hit/miss counters of this process."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': lookups and float(self.hits) / lookups or 0.0,
+        }
+
+
+class LRUCache(object):
+    """In-memory cache holding at most `maxlen` entries."""
+
+    def __init__(self, maxlen=1024):
+        self.maxlen = maxlen
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the value stored for `key`, or None."""
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Store `value` for `key`, dropping the oldest entry if full."""
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            if len(self._data) > self.maxlen:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-#
+#
+#
+# Copyright (C) 2018, S3IT, University of Zurich. All rights reserved.
+#
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""
+Index of the issues each message and file belongs to.
+
+The View permission of messages and files depends on the issue they
+are attached to, which roundup can only find by looking at every
+issue (`db.issue.find(messages=msgid)`). The index keeps the ids of
+the issues of each message and file on disk instead::
+
+    index = get_index(db.config.DATABASE)
+    issueids = index.lookup('msg', msgid)
+    if issueids is None:
+        # not indexed yet
+        issueids = db.issue.find(messages=msgid)
+
+The index is built from the existing issues by
+`scripts/roundup-issueindex`, and then updated when an issue is
+committed (see the reactors in `detectors/issueindex.py`). Until it's
+built, updates are ignored and `lookup()` always returns None, so
+that no item is recorded with only some of its issues.
+
+The index lives in the `cache/issueindex` directory of the database,
+and is shared by all the roundup processes of the tracker.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import errno
+import fcntl
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+# Multilink properties of the issues indexed
+PROPERTIES = {'msg': 'messages', 'file': 'files'}
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(db_dir):
+    """Return the process-wide `IssueIndex` of the database in `db_dir`."""
+    path = os.path.abspath(os.path.join(db_dir, 'cache', 'issueindex'))
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = IssueIndex(path)
+        return _indexes[path]
+
+
+class IssueIndex(object):
+    """Map each message and file to the ids of its issues, stored in
+    directory `path`.
+
+    Every item is a file `<path>/<classname>/<last two digits>/<id>`
+    with the comma-separated ids of the issues. Files are replaced
+    atomically, so that reading doesn't need any lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._built = False
+
+    def built(self):
+        """Return True if the index was built by `rebuild()`."""
+        # once built, the index stays so for the life of the process
+        if not self._built:
+            self._built = os.path.exists(os.path.join(self.path, '.built'))
+        return self._built
+
+    def _filename(self, classname, itemid):
+        itemid = str(itemid)
+        return os.path.join(self.path, classname, itemid[-2:], itemid)
+
+    def lookup(self, classname, itemid):
+        """Return the ids of the issues item `itemid` of class
+        `classname` belongs to, lowest first, or None if the item is
+        not in the index."""
+        if not self.built():
+            return None
+        try:
+            with open(self._filename(classname, itemid), 'rb') as fd:
+                value = fd.read()
+        except (IOError, OSError):
+            return None
+        return value.split(',') if value else []
+
+    def _store(self, classname, itemid, issueids):
+        fname = self._filename(classname, itemid)
+        dirname = os.path.dirname(fname)
+        try:
+            os.makedirs(dirname)
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+        fd, tmpname = tempfile.mkstemp(dir=dirname, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(','.join(sorted(set(issueids), key=int)))
+            os.rename(tmpname, fname)
+        except:
+            os.remove(tmpname)
+            raise
+
+    @contextmanager
+    def _locked(self):
+        # several processes may update the same entries
+        try:
+            os.makedirs(self.path)
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+        with open(os.path.join(self.path, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def update(self, issueid, added, removed):
+        """Record that the items in `added`, a dictionary mapping a
+        class name to a list of ids, now belong to issue `issueid`,
+        and the ones in `removed` no longer do. Nothing is done if the
+        index wasn't built yet."""
+        with self._locked():
+            if not self.built():
+                return
+            for classname, itemids in added.items():
+                for itemid in itemids:
+                    issueids = self.lookup(classname, itemid) or []
+                    if issueid not in issueids:
+                        self._store(classname, itemid, issueids + [issueid])
+            for classname, itemids in removed.items():
+                for itemid in itemids:
+                    issueids = self.lookup(classname, itemid)
+                    if issueids and issueid in issueids:
+                        issueids.remove(issueid)
+                        self._store(classname, itemid, issueids)
+
+    def rebuild(self, db):
+        """Replace the content of the index with the messages and files
+        of all the issues in `db`. Return the number of items indexed."""
+        entries = {}
+        for issueid in db.issue.getnodeids(retired=False):
+            for classname, propname in PROPERTIES.items():
+                for itemid in db.issue.get(issueid, propname):
+                    entries.setdefault((classname, itemid), []).append(issueid)
+        with self._locked():
+            for classname in PROPERTIES:
+                shutil.rmtree(os.path.join(self.path, classname),
+                              ignore_errors=True)
+            for (classname, itemid), issueids in entries.items():
+                self._store(classname, itemid, issueids)
+            open(os.path.join(self.path, '.built'), 'w').close()
+        return len(entries)
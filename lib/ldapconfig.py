@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-#
+#
+#
+# Copyright (C) 2018, S3IT, University of Zurich. All rights reserved.
+#
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""
+Loader for `ldap_config.ini`, shared by the `ldap_auth` extension and
+the `ldapuserauditor` detector.
+
+The file is parsed once per process, and parsed again only when its
+modification time changes::
+
+    cfg = get_config(db.config.ext['HOME'])
+    if cfg is None or cfg.missing(['server_uri', 'base_dn']):
+        return
+    server_uri = cfg.options['server_uri']
+"""
+
+__docformat__ = 'reStructuredText'
+
+from ConfigParser import RawConfigParser
+import logging
+import os
+import threading
+
+CONFIG_FILE = 'ldap_config.ini'
+
+BOOLEAN_OPTIONS = ['use_local_auth', 'autocreate', 'bind_once', 'debug']
+INTEGER_OPTIONS = ['referrals', 'start_tls', 'timeout', 'pool_size',
+                   'auth_cache_ttl', 'mail_cache_ttl',
+                   'mail_negative_cache_ttl']
+
+_configs = {}
+_configs_lock = threading.Lock()
+
+
+def get_config(tracker_home, log=None):
+    """Return the `LDAPConfig` of the tracker in `tracker_home`, or None
+    if the tracker has no `ldap_config.ini` file."""
+    log = log or logging.getLogger('roundup.ldapconfig')
+    path = os.path.join(tracker_home, CONFIG_FILE)
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        log.debug("Ldap configuration file %s not found.", path)
+        return None
+
+    with _configs_lock:
+        cfg = _configs.get(path)
+        if cfg is None or cfg.mtime != mtime:
+            log.info("Reading configuration file %s", path)
+            cfg = LDAPConfig(path, mtime)
+            if not cfg.has_section:
+                log.info("No section 'ldap' in configuration file %s.", path)
+            for key, value in sorted(cfg.options.items()):
+                if key.endswith('_pw'):
+                    value = '*****'
+                log.debug("Setting option %s to %s", key, value)
+            _configs[path] = cfg
+        return cfg
+
+
+class LDAPConfig(object):
+    """Options of the `ldap` section of `path`.
+
+    `options` maps each option found in the file to its value; the
+    options listed in `BOOLEAN_OPTIONS` and `INTEGER_OPTIONS` are
+    converted to the corresponding type.
+    """
+
+    def __init__(self, path, mtime):
+        self.path = path
+        self.mtime = mtime
+        self.options = {}
+
+        cfg = RawConfigParser()
+        cfg.read(path)
+        self.has_section = cfg.has_section('ldap')
+        if not self.has_section:
+            return
+        for key, value in cfg.items('ldap'):
+            if key in BOOLEAN_OPTIONS:
+                value = cfg.getboolean('ldap', key)
+            elif key in INTEGER_OPTIONS:
+                value = cfg.getint('ldap', key)
+            self.options[key] = value
+
+    def missing(self, required):
+        """Return the options in `required` which are not set."""
+        return [opt for opt in required if opt not in self.options]
+
+    def realname(self, attrs):
+        """Return the real name of the LDAP entry `attrs`: the value of
+        `aliasname_attribute` if set, else "surname, givenname"."""
+        def first(option):
+            attr = self.options.get(option)
+            return attrs.get(attr, [''])[0] if attr else ''
+
+        aliasname = first('aliasname_attribute')
+        if aliasname:
+            return aliasname
+        sn = first('surname_attribute')
+        gn = first('givenname_attribute')
+        if sn and gn:
+            return "%s, %s" % (sn, gn)
+        return sn
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-#
+#
+#
+# Copyright (C) 2018, S3IT, University of Zurich. All rights reserved.
+#
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""
+Cache of the LDAP entries found for an email address.
+
+`ldapuserauditor` looks up in LDAP the address of every user created
+by the mail gateway, most of which are spammers. The result of the
+lookup, a list of `(uid, realname)` pairs, is kept on disk for `ttl`
+seconds; addresses which are not in the directory are remembered as
+an empty list, usually for a shorter time::
+
+    cache = get_cache(db.config.DATABASE)
+    users = cache.lookup(address)
+    if users is None:
+        users = search_ldap(address)
+        cache.store(address, users, ttl if users else negative_ttl)
+
+The cache lives in the `cache/ldapmail` directory of the database, and
+is shared by all the roundup processes of the tracker.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import json
+import os
+import threading
+import time
+
+from diskcache import get_cache as get_disk_cache
+
+# lifetime of the entries found in LDAP, in seconds
+DEFAULT_TTL = 24 * 3600
+
+# lifetime of the addresses not found in LDAP, in seconds
+DEFAULT_NEGATIVE_TTL = 3600
+
+# size of the cache directory
+MAX_SIZE = 8 * 1024 * 1024
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(db_dir):
+    """Return the process-wide `MailCache` of the database in `db_dir`."""
+    path = os.path.abspath(os.path.join(db_dir, 'cache', 'ldapmail'))
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = MailCache(get_disk_cache(path, MAX_SIZE))
+        return _caches[path]
+
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+class MailCache(object):
+    """Map an email address to the `(uid, realname)` of its LDAP
+    entries, stored in the `DiskCache` `cache`."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def _key(self, address):
+        return self.cache.key('ldapmail', address.strip().lower())
+
+    def lookup(self, address):
+        """Return the list of `(uid, realname)` stored for `address`,
+        or None if it's not in the cache or has expired. An empty list
+        means that `address` is not in LDAP."""
+        value = self.cache.get(self._key(address))
+        if value is None:
+            return None
+        try:
+            entry = json.loads(value)
+            if entry['expires'] < time.time():
+                return None
+            return [(_encode(uid), _encode(realname))
+                    for uid, realname in entry['users']]
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def store(self, address, users, ttl):
+        """Remember the list of `(uid, realname)` found for `address`
+        for `ttl` seconds."""
+        if ttl <= 0:
+            return
+        self.cache.set(self._key(address), json.dumps(
+            {'expires': time.time() + ttl, 'users': list(users)}))
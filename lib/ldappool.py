@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-#
+#
+#
+# Copyright (C) 2018, S3IT, University of Zurich. All rights reserved.
+#
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""
+Process-wide pool of LDAP connections bound with the search account.
+
+Opening a connection, starting TLS and binding costs several round
+trips to the LDAP server. The pool keeps up to `size` connections open
+and bound as `bind_dn`, and hands them out for searches::
+
+    pool = get_pool(server_uri, search_bind_dn, search_bind_pw)
+    users = pool.search_st(base_dn, ldap.SCOPE_SUBTREE, '(uid=foo)')
+    pool.simple_bind_s(users[0][0], password)
+
+`simple_bind_s()` verifies a password by rebinding a pooled
+connection; the connection is bound again as `bind_dn` the next time
+it's used for a search.
+
+Connections idle for more than `check_interval` seconds are checked
+with a "Who am I?" request before being used. If the server went
+away (`ldap.SERVER_DOWN`) the connection is dropped and the operation
+is retried once on a new connection.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import logging
+import threading
+import time
+
+import ldap
+
+# Log the pool counters every `STATS_INTERVAL` operations
+STATS_INTERVAL = 100
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(server_uri, bind_dn, bind_pw, **kw):
+    """Return the process-wide pool for `server_uri` and `bind_dn`.
+
+    Keyword arguments are passed to `LDAPConnectionPool` when the pool
+    is created.
+    """
+    with _pools_lock:
+        key = (server_uri, bind_dn)
+        if key not in _pools:
+            _pools[key] = LDAPConnectionPool(server_uri, bind_dn, bind_pw, **kw)
+        pool = _pools[key]
+        # the password may have been changed in the configuration
+        pool.bind_pw = bind_pw
+        return pool
+
+
+class PoolExhausted(ldap.SERVER_DOWN):
+    """No connection became available within the timeout."""
+
+
+class PooledConnection(object):
+    def __init__(self, conn, bound_dn):
+        self.conn = conn
+        self.bound_dn = bound_dn
+        self.last_used = time.time()
+
+
+class LDAPConnectionPool(object):
+    """A bounded pool of LDAP connections bound as `bind_dn`."""
+
+    def __init__(self, server_uri, bind_dn, bind_pw, size=4, start_tls=0,
+                 timeout=10, check_interval=60, log=None):
+        self.server_uri = server_uri
+        self.bind_dn = bind_dn
+        self.bind_pw = bind_pw
+        self.size = size
+        self.start_tls = start_tls
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.log = log or logging.getLogger('roundup.ldappool')
+
+        self._idle = []
+        self._created = 0
+        self._cond = threading.Condition(threading.Lock())
+
+        self.stats = {
+            'operations': 0,
+            'connects': 0,
+            'reused': 0,
+            'rebinds': 0,
+            'health_checks': 0,
+            'reconnects': 0,
+            'waits': 0,
+        }
+
+    def _connect(self):
+        self.log.debug("Opening new pooled connection to %r", self.server_uri)
+        conn = ldap.initialize(self.server_uri)
+        conn.set_option(ldap.OPT_PROTOCOL_VERSION, ldap.VERSION3)
+        conn.set_option(ldap.OPT_NETWORK_TIMEOUT, self.timeout)
+        if self.start_tls and self.server_uri.startswith('ldap:'):
+            conn.start_tls_s()
+        conn.simple_bind_s(self.bind_dn, self.bind_pw)
+        self.stats['connects'] += 1
+        return PooledConnection(conn, self.bind_dn)
+
+    def _discard(self, pconn):
+        try:
+            pconn.conn.unbind_s()
+        except ldap.LDAPError:
+            pass
+        with self._cond:
+            self._created -= 1
+            self._cond.notify()
+
+    def _healthy(self, pconn):
+        if time.time() - pconn.last_used < self.check_interval:
+            return True
+        self.stats['health_checks'] += 1
+        try:
+            pconn.conn.whoami_s()
+            return True
+        except ldap.LDAPError as ex:
+            self.log.info("Dropping stale LDAP connection to %r: %s",
+                          self.server_uri, ex)
+            return False
+
+    def acquire(self):
+        """Return a connection bound as `bind_dn`."""
+        deadline = time.time() + self.timeout
+        while True:
+            with self._cond:
+                if self._idle:
+                    pconn = self._idle.pop()
+                elif self._created < self.size:
+                    self._created += 1
+                    pconn = None
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise PoolExhausted(
+                            "No LDAP connection available after %ds" % self.timeout)
+                    self.stats['waits'] += 1
+                    self._cond.wait(remaining)
+                    continue
+
+            if pconn is None:
+                try:
+                    return self._connect()
+                except:
+                    with self._cond:
+                        self._created -= 1
+                        self._cond.notify()
+                    raise
+
+            if not self._healthy(pconn):
+                self._discard(pconn)
+                continue
+            self.stats['reused'] += 1
+            if pconn.bound_dn != self.bind_dn:
+                # it was used to check a user password
+                try:
+                    pconn.conn.simple_bind_s(self.bind_dn, self.bind_pw)
+                except ldap.SERVER_DOWN:
+                    self._discard(pconn)
+                    continue
+                except:
+                    self._discard(pconn)
+                    raise
+                pconn.bound_dn = self.bind_dn
+                self.stats['rebinds'] += 1
+            return pconn
+
+    def release(self, pconn):
+        """Give back a connection obtained with `acquire()`."""
+        pconn.last_used = time.time()
+        with self._cond:
+            self._idle.append(pconn)
+            self._cond.notify()
+
+    def _run(self, operation):
+        """Call `operation(pconn)` on a pooled connection, retrying
+        once on a new connection if the server went down."""
+        self.stats['operations'] += 1
+        if self.stats['operations'] % STATS_INTERVAL == 0:
+            self.log_stats()
+        for attempt in (1, 2):
+            pconn = self.acquire()
+            try:
+                result = operation(pconn)
+            except ldap.SERVER_DOWN:
+                self._discard(pconn)
+                if attempt == 2:
+                    raise
+                self.stats['reconnects'] += 1
+                self.log.info("LDAP server %r went down, reconnecting",
+                              self.server_uri)
+                continue
+            except ldap.INVALID_CREDENTIALS:
+                # a failed bind leaves the connection anonymous
+                pconn.bound_dn = None
+                self.release(pconn)
+                raise
+            except:
+                self._discard(pconn)
+                raise
+            self.release(pconn)
+            return result
+
+    def search_st(self, base, scope, filterstr, attrlist=None, timeout=-1):
+        """Same as `LDAPObject.search_st`, using a pooled connection."""
+        return self._run(lambda pconn: pconn.conn.search_st(
+            base, scope, filterstr, attrlist=attrlist, timeout=timeout))
+
+    def simple_bind_s(self, who, cred):
+        """Check the password `cred` of `who` by rebinding a pooled
+        connection. Raises `ldap.INVALID_CREDENTIALS` on failure."""
+        def bind(pconn):
+            pconn.bound_dn = who
+            pconn.conn.simple_bind_s(who, cred)
+        return self._run(bind)
+
+    def log_stats(self):
+        with self._cond:
+            idle = len(self._idle)
+            created = self._created
+        self.log.info("LDAP pool %s@%s: %d connections (%d idle); %s",
+                      self.bind_dn, self.server_uri, created, idle,
+                      ', '.join('%s=%d' % item for item in sorted(self.stats.items())))
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-#
+#
+#
+# Copyright (C) 2018, S3IT, University of Zurich. All rights reserved.
+#
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""
+Transactional outbox for the emails sent by the detectors.
+
+When the outbox is enabled, the messages which roundup would send
+while a detector runs inside `capture()` are not sent: they are kept
+in memory and written to the outbox directory when the transaction is
+committed (and forgotten if it's rolled back). `scripts/roundup-outbox`
+delivers them::
+
+    with capture(db, get_outbox(db.config)):
+        cl.nosymessage(nodeid, msgid, oldvalues)
+
+Capturing works by replacing `roundupdb.Mailer` with `OutboxMailer`,
+which only diverts the messages sent by the thread inside `capture()`.
+
+The outbox is enabled by the `enabled` option of the `[outbox]`
+section of `detectors/config.ini`.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import base64
+import os
+import threading
+from contextlib import contextmanager
+
+from roundup import roundupdb
+
+from chatspool import Spool
+from smtppool import PooledMailer
+
+_local = threading.local()
+
+
+def get_outbox(config, log=None):
+    """Return the `Outbox` of the tracker, or None if it's not enabled
+    in `config.detectors`."""
+    try:
+        enabled = config.detectors['OUTBOX_ENABLED']
+    except KeyError:
+        return None
+    if enabled.lower() not in ('yes', 'true', '1'):
+        return None
+    install()
+    return Outbox(os.path.join(config.DATABASE, 'outbox'), log)
+
+
+def install():
+    """Make roundup send its messages with `OutboxMailer`."""
+    if roundupdb.Mailer is not OutboxMailer:
+        roundupdb.Mailer = OutboxMailer
+
+
+class OutboxMailer(PooledMailer):
+    """A `Mailer` which stages the messages sent inside `capture()`."""
+
+    def smtp_send(self, to, message, sender=None):
+        staged = getattr(_local, 'staged', None)
+        if staged is None:
+            return PooledMailer.smtp_send(self, to, message, sender)
+        staged.append({
+            'sender': sender or self.config.ADMIN_EMAIL,
+            'to': list(to),
+            # the message may not be valid utf-8
+            'message': base64.b64encode(message),
+        })
+
+
+@contextmanager
+def capture(db, outbox):
+    """Stage the messages sent in the block, and write them to
+    `outbox` when `db` is committed. If `outbox` is None the messages
+    are sent immediately."""
+    if outbox is None:
+        yield
+        return
+    _local.staged = staged = []
+    try:
+        yield
+    finally:
+        _local.staged = None
+    if staged:
+        db.transactions.append((outbox.enqueue_all, (staged,)))
+
+
+class Outbox(Spool):
+    """Queue of email messages, stored in directory `path`."""
+
+    def enqueue_all(self, messages):
+        for message in messages:
+            self.enqueue(message)
+
+    @staticmethod
+    def message(entry):
+        """Return the text of the message in `entry`."""
+        return base64.b64decode(entry['message'])
+
+    def send(self, config, entry):
+        """Send the message in `entry`."""
+        PooledMailer(config).smtp_send(entry['to'], self.message(entry),
+                                       entry['sender'])
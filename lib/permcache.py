@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-#
+#
+#
+# Copyright (C) 2018, S3IT, University of Zurich. All rights reserved.
+#
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""
+Cache of the decisions of the permission check functions.
+
+Rendering an issue checks the permissions of the user on the same
+issue many times (once per property, and once per message or file),
+and every time the check functions defined in `schema.py` read the
+issue again. `cached()` wraps a check function so that its decision
+is remembered for the rest of the transaction::
+
+    p = db.security.addPermission(name='View', klass='issue',
+        check=cached('View', 'issue', public_or_owned_issue))
+
+Decisions are keyed by `(userid, permission, class, itemid)`. They
+are forgotten at the end of every transaction (commit or rollback).
+Once an issue is created or changed (see `detectors/permcache.py`)
+nothing is cached until the end of the transaction: the anydbm
+backend doesn't clear the caches on rollback, so decisions based on
+uncommitted changes could outlive them.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import logging
+
+log = logging.getLogger('roundup.permcache')
+
+
+def get_cache(db):
+    """Return the `PermissionCache` of the database handle `db`."""
+    cache = getattr(db, 'permission_cache', None)
+    if cache is None:
+        cache = db.permission_cache = PermissionCache()
+        db.registerClearCacheCallback(PermissionCache.invalidate, cache)
+    return cache
+
+
+def cached(permission, klass, check):
+    """Return a check function remembering the decisions of `check`."""
+    def cached_check(db, userid, itemid):
+        return get_cache(db).check(db, userid, permission, klass, itemid,
+                                   check)
+    return cached_check
+
+
+class PermissionCache(object):
+    """Map `(userid, permission, class, itemid)` to the result of the
+    check function."""
+
+    def __init__(self):
+        self._decisions = {}
+        self._suspended = False
+        # checks answered from the cache, and actually run, since the
+        # cache was created
+        self.hits = 0
+        self.misses = 0
+        self._last_hits = 0
+
+    def invalidate(self):
+        """Forget all the decisions."""
+        self._decisions.clear()
+        self._suspended = False
+        if self.hits > self._last_hits:
+            log.debug("%d permission checks avoided (%d since created, "
+                      "%d run)", self.hits - self._last_hits, self.hits,
+                      self.misses)
+            self._last_hits = self.hits
+
+    def suspend(self):
+        """Forget all the decisions, and stop caching them until the
+        next `invalidate()`."""
+        self._decisions.clear()
+        self._suspended = True
+
+    def check(self, db, userid, permission, klass, itemid, check):
+        """Return the result of `check(db, userid, itemid)`, running it
+        only the first time."""
+        if self._suspended:
+            self.misses += 1
+            return check(db, userid, itemid)
+        key = (userid, permission, klass, str(itemid))
+        try:
+            decision = self._decisions[key]
+        except KeyError:
+            self.misses += 1
+            decision = self._decisions[key] = check(db, userid, itemid)
+            return decision
+        self.hits += 1
+        return decision
+
+    def stats(self):
+        """Return a dictionary with the hit/miss counters."""
+        checks = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': checks and float(self.hits) / checks or 0.0,
+        }
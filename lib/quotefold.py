@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-#
+#
+#
+# Copyright (C) 2018, S3IT, University of Zurich. All rights reserved.
+#
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""
+In-process replacement for ``t-prot -t -s --body``.
+
+The body of a message is processed in the same way t-prot does:
+
+* the signature, i.e. everything following the last ``-- `` line, is
+  removed;
+
+* if the message ends with a block of quoted lines (TOFU, "text
+  over, fullquote under") the block is replaced by a single line
+  telling how many lines have been snipped.
+
+Quoted text in the middle of the message (interleaved replies) is
+left untouched.
+
+Run this file to compare the speed of `fold()` with the t-prot
+subprocess on a set of synthetic messages::
+
+    python lib/quotefold.py [number of messages]
+"""
+
+__docformat__ = 'reStructuredText'
+
+import re
+
+# Same message t-prot uses for stripped TOFU
+TOFU_MSG = '[---=| TOFU protection by t-prot: %d lines snipped |=---]'
+
+SIGDASHES = '-- '
+
+quote_re = re.compile(r'^\s*>')
+
+
+def fold(text):
+    """Strip signature and trailing full quote from `text`."""
+    lines = text.split('\n')
+
+    # Remove the signature: everything after the last sig dashes.
+    for i in xrange(len(lines) - 1, -1, -1):
+        if lines[i].rstrip('\r') == SIGDASHES:
+            del lines[i:]
+            break
+
+    # Look for a quote block at the end of the message. Empty lines
+    # between the quoted lines and at the end of the message are
+    # part of the block.
+    end = len(lines)
+    while end and not lines[end-1].strip():
+        end -= 1
+    start = end
+    while start and (quote_re.match(lines[start-1])
+                     or not lines[start-1].strip()):
+        start -= 1
+    while start < end and not lines[start].strip():
+        start += 1
+
+    # Only fold if there is some text above the quote, otherwise
+    # nothing would be left of the message.
+    above = [l for l in lines[:start] if l.strip()]
+    if start < end and above:
+        snipped = end - start
+        lines[start:] = [TOFU_MSG % snipped]
+
+    return '\n'.join(lines)
+
+
+def fold_many(texts):
+    """Apply `fold()` to every text in `texts`, return a list."""
+    return [fold(text) for text in texts]
+
+
+if "__main__" == __name__:
+    import subprocess
+    import sys
+    import time
+
+    nmsgs = len(sys.argv) > 1 and int(sys.argv[1]) or 50
+
+    body = '\n'.join(["Dear all,", "",
+                      "the job is still failing, see the output below.",
+                      ""] + ["line %d of the log" % i for i in range(20)])
+    quote = '\n'.join(["> " + l for l in body.split('\n')] * 3)
+    sig = "-- \nS3IT - Services and Support for Science IT\nUniversity of Zurich"
+    messages = ["%s\n\nOn Mon, someone wrote:\n%s\n%s\n%d" % (body, quote, sig, i)
+                for i in range(nmsgs)]
+
+    t0 = time.time()
+    folded = fold_many(messages)
+    t_fold = time.time() - t0
+    print "in-process: %d messages in %.4fs" % (nmsgs, t_fold)
+
+    t0 = time.time()
+    try:
+        for text in messages:
+            pipe = subprocess.Popen(['t-prot', '-t', '-s', '--body'],
+                                    stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE)
+            pipe.communicate(input=text)
+    except OSError as ex:
+        print "t-prot: not available (%s)" % ex
+    else:
+        t_tprot = time.time() - t0
+        print "t-prot:     %d messages in %.4fs (%.0fx slower)" % (
+            nmsgs, t_tprot, t_tprot / max(t_fold, 1e-6))
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-#
+#
+#
+# Copyright (C) 2018, S3IT, University of Zurich. All rights reserved.
+#
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""
+Index of the users having each role.
+
+Checking the roles of many users (e.g. to remove the non-operators
+from a nosy list) loads the `roles` property of every user. The index
+reads them all once, and then answers with a set lookup::
+
+    operators = get_index(db).users_with('Operator')
+    recipients = [uid for uid in issue.nosy if uid not in operators]
+
+The index belongs to a database handle. It's rebuilt after every
+commit or rollback. When the roles of a user change (see the reactors
+in `detectors/userauditor.py`) it's read again at every lookup until
+the end of the transaction, since the anydbm backend doesn't tell us
+about rollbacks.
+"""
+
+__docformat__ = 'reStructuredText'
+
+from roundup.hyperdb import iter_roles
+
+
+def get_index(db):
+    """Return the `RoleIndex` of the database handle `db`."""
+    index = getattr(db, 'role_index', None)
+    if index is None:
+        index = db.role_index = RoleIndex(db)
+        db.registerClearCacheCallback(RoleIndex.invalidate, index)
+    return index
+
+
+class RoleIndex(object):
+    """Map each role to the set of ids of the users having it."""
+
+    def __init__(self, db):
+        self.db = db
+        self._users = None
+        self._changed = False
+
+    def invalidate(self):
+        """Forget the roles; they're read again at the next lookup."""
+        self._users = None
+        self._changed = False
+
+    def changed(self):
+        """Read the roles at every lookup until the next
+        `invalidate()`."""
+        self._users = None
+        self._changed = True
+
+    def _build(self):
+        users = {}
+        for userid in self.db.user.getnodeids():
+            roles = self.db.user.get(userid, 'roles')
+            if not roles or not roles.strip():
+                continue
+            for role in iter_roles(roles):
+                users.setdefault(role, set()).add(userid)
+        return users
+
+    def users_with(self, role):
+        """Return the set of ids of the users having `role`."""
+        users = self._users
+        if users is None:
+            users = self._build()
+            if not self._changed:
+                self._users = users
+        return users.get(role.strip().lower(), frozenset())
+
+    def has_role(self, userid, *roles):
+        """Same as `db.user.has_role()`."""
+        for role in roles:
+            if userid in self.users_with(role):
+                return True
+        return False
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-#
+#
+#
+# Copyright (C) 2018, S3IT, University of Zurich. All rights reserved.
+#
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""
+Apply a table of regular expression substitutions in a single pass.
+
+A rule table is a list of `(regexp, replacement)` pairs, which would
+normally be applied one after the other::
+
+    for regexp, replacement in rules:
+        text = regexp.sub(replacement, text)
+
+`RuleScanner` joins all the regular expressions in a single
+alternation, so that the text is scanned only once. The output is
+the same as the one of the sequential version: since the rules
+following the one that matched would also be applied to the text it
+inserted, the scanner applies them to the replacement string.
+
+This is only correct as long as no rule can match across the
+boundary of the text inserted by a previous rule. This is the case
+for rules which only match "words", and replace them with a link.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import re
+import sre_parse
+import threading
+
+# `(?P<name>` opening a named group
+named_group_re = re.compile(r'\(\?P<([a-zA-Z_][a-zA-Z0-9_]*)>')
+
+# maximum number of replacements remembered by a scanner
+CASCADE_CACHE_SIZE = 1024
+
+_scanners = {}
+_scanners_lock = threading.Lock()
+
+
+def get_scanner(name, rules):
+    """Return the process-wide `RuleScanner` for the table `name`.
+
+    The scanner is built the first time it's requested; the rule
+    table is only compiled once per process.
+    """
+    with _scanners_lock:
+        if name not in _scanners:
+            _scanners[name] = RuleScanner(rules)
+        return _scanners[name]
+
+
+class RuleScanner(object):
+    """Single-pass version of a list of `(regexp, replacement)` rules.
+
+    `regexp` can be either a string or a compiled regular expression.
+    All the regular expressions must use the same flags.
+    """
+
+    def __init__(self, rules):
+        self.rules = []
+        for regexp, replacement in rules:
+            if isinstance(regexp, basestring):
+                regexp = re.compile(regexp)
+            if '(?P=' in regexp.pattern:
+                raise ValueError("Backreferences are not supported: %s"
+                                 % regexp.pattern)
+            self.rules.append((regexp, replacement))
+
+        flags = set(regexp.flags for regexp, replacement in self.rules)
+        if len(flags) > 1:
+            raise ValueError("All the rules must use the same flags")
+
+        # One named group per rule tells us which one matched. Inner
+        # named groups are renamed, to avoid name clashes between
+        # rules.
+        alternatives = []
+        for i, (regexp, replacement) in enumerate(self.rules):
+            pattern = named_group_re.sub(r'(?P<rule%d_\1>' % i, regexp.pattern)
+            alternatives.append('(?P<rule%d>%s)' % (i, pattern))
+        self.scanner = re.compile('|'.join(alternatives), flags and flags.pop() or 0)
+
+        # The replacements are parsed once (match.expand() would parse
+        # them every time), and their group references are shifted
+        # to point to the groups of the rule in `self.scanner`.
+        self.templates = {}
+        for i, (regexp, replacement) in enumerate(self.rules):
+            offset = self.scanner.groupindex['rule%d' % i]
+            groups, literals = sre_parse.parse_template(replacement, regexp)
+            self.templates['rule%d' % i] = (
+                i, ([(index, group + offset) for index, group in groups], literals))
+
+        # Output of the rules following the one that matched, indexed
+        # by rule and replacement text.
+        self._cascade = {}
+
+    def _replace(self, match):
+        i, template = self.templates[match.lastgroup]
+        text = sre_parse.expand_template(template, match)
+        try:
+            return self._cascade[i, text]
+        except KeyError:
+            pass
+        output = text
+        for regexp, replacement in self.rules[i+1:]:
+            output = regexp.sub(replacement, output)
+        if len(self._cascade) >= CASCADE_CACHE_SIZE:
+            self._cascade.clear()
+        self._cascade[i, text] = output
+        return output
+
+    def sub(self, text):
+        """Apply all the rules to `text`."""
+        return self.scanner.sub(self._replace, text)
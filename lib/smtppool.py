@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-#
+#
+#
+# Copyright (C) 2018, S3IT, University of Zurich. All rights reserved.
+#
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""
+SMTP connections shared by all the messages sent by a process.
+
+Roundup's `Mailer.smtp_send()` opens a new SMTP connection (with TLS
+handshake and login) for every message. `PooledMailer` sends through
+the process-wide `SMTPTransport` of the mail host instead, which keeps
+the connections open and reuses them for the following messages::
+
+    mailer = PooledMailer(db.config)
+    mailer.smtp_send(['someone@example.org'], message)
+
+    # or, several messages on the same connection
+    get_transport(db.config).send_many([(sender, to, message), ...])
+
+A connection idle for more than `IDLE_TIMEOUT` seconds is closed
+rather than reused, since most servers drop idle clients. If a reused
+connection turns out to be closed by the server, the message is sent
+again on a new connection.
+
+`install()` makes roundup use `PooledMailer` for the nosy messages.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import logging
+import smtplib
+import socket
+import threading
+import time
+
+from roundup import roundupdb
+from roundup.mailer import Mailer, MessageSendError, SMTPConnection
+
+# seconds after which an idle connection is closed
+IDLE_TIMEOUT = 30
+
+# maximum number of idle connections kept open
+MAX_IDLE = 4
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(config):
+    """Return the process-wide `SMTPTransport` for the mail host in
+    `config`."""
+    key = (config.MAILHOST, config['MAIL_PORT'], config['MAIL_USERNAME'])
+    with _transports_lock:
+        if key not in _transports:
+            _transports[key] = SMTPTransport(config)
+        return _transports[key]
+
+
+def install():
+    """Make roundup send its messages with `PooledMailer`."""
+    if not issubclass(roundupdb.Mailer, PooledMailer):
+        roundupdb.Mailer = PooledMailer
+
+
+class SMTPTransport(object):
+    """Pool of SMTP connections to the mail host of `config`."""
+
+    def __init__(self, config, log=None):
+        self.config = config
+        self.log = log or logging.getLogger('roundup.smtppool')
+        self._idle = []
+        self._lock = threading.Lock()
+        self.stats = {'connects': 0, 'reused': 0, 'reconnects': 0, 'sent': 0}
+
+    def _connect(self):
+        self.stats['connects'] += 1
+        return SMTPConnection(self.config)
+
+    def _close(self, conn):
+        try:
+            conn.quit()
+        except (smtplib.SMTPException, socket.error):
+            conn.close()
+
+    def acquire(self):
+        """Return `(conn, reused)`: an open connection, and whether it
+        was already used."""
+        now = time.time()
+        stale = []
+        conn = None
+        with self._lock:
+            while self._idle:
+                idle_conn, last_used = self._idle.pop()
+                if now - last_used < IDLE_TIMEOUT:
+                    conn = idle_conn
+                    break
+                stale.append(idle_conn)
+        for idle_conn in stale:
+            self._close(idle_conn)
+        if conn is not None:
+            self.stats['reused'] += 1
+            return conn, True
+        return self._connect(), False
+
+    def release(self, conn):
+        with self._lock:
+            if len(self._idle) < MAX_IDLE:
+                self._idle.append((conn, time.time()))
+                return
+        self._close(conn)
+
+    def send_many(self, messages):
+        """Send each `(sender, to, message)` of `messages` on the same
+        connection."""
+        conn, reused = self.acquire()
+        try:
+            for sender, to, message in messages:
+                try:
+                    conn.sendmail(sender, to, message)
+                except (smtplib.SMTPServerDisconnected, socket.error):
+                    if not reused:
+                        raise
+                    # the server closed the connection while it was
+                    # idle, nothing was sent.
+                    self.stats['reconnects'] += 1
+                    conn.close()
+                    conn = self._connect()
+                    conn.sendmail(sender, to, message)
+                reused = True
+                self.stats['sent'] += 1
+        except:
+            conn.close()
+            raise
+        self.release(conn)
+
+    def sendmail(self, sender, to, message):
+        self.send_many([(sender, to, message)])
+
+
+class PooledMailer(Mailer):
+    """A `Mailer` sending through the `SMTPTransport` of the mail host."""
+
+    def smtp_send(self, to, message, sender=None):
+        if self.debug:
+            return Mailer.smtp_send(self, to, message, sender)
+        if not sender:
+            sender = self.config.ADMIN_EMAIL
+        try:
+            get_transport(self.config).sendmail(sender, to, message)
+        except socket.error, value:
+            raise MessageSendError("Error: couldn't send email: "
+                                   "mailhost %s"%value)
+        except smtplib.SMTPException, msg:
+            raise MessageSendError("Error: couldn't send email: %s"%msg)
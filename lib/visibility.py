@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-#
+#
+#
+# Copyright (C) 2018, S3IT, University of Zurich. All rights reserved.
+#
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""
+Which issues a user may view.
+
+Users with the `User` role may only view the public issues, the ones
+they created and the ones they are subscribed to
+(`public_or_owned_issue()`, the check function of their View
+permission). Checking it for every issue of a list loads every issue,
+even those which are not shown. `visible_issues()` returns the ids of
+all the issues a user may view at once, so lists can be filtered with
+a set lookup::
+
+    visible = visible_issues(db, userid)
+    issueids = db.issue.filter(None, filterspec, sort, group)
+    if visible is not None:
+        issueids = [issueid for issueid in issueids if issueid in visible]
+
+The View permissions on issues with a check function are assumed to
+use `public_or_owned_issue()` (possibly wrapped by
+`permcache.cached()`), since that's the only one in `schema.py`.
+"""
+
+__docformat__ = 'reStructuredText'
+
+from roundup import hyperdb
+
+
+def public_or_owned_issue(db, userid, itemid):
+    """Check function: True if issue `itemid` is public, or `userid`
+    created it or is subscribed to it."""
+    item = db.issue.getnode(itemid)
+    return item.public or item.creator == userid or userid in item.nosy
+
+
+def visible_issues(db, userid):
+    """Return the set of ids of the issues `userid` may view, or None
+    if they may view all of them."""
+    conditional = False
+    for rolename in db.user.get_roles(userid):
+        role = db.security.role.get(rolename)
+        if role is None:
+            continue
+        for perm in role.permissions:
+            if perm.name != 'View' or perm.klass not in (None, 'issue'):
+                continue
+            if perm.check is None:
+                return None
+            conditional = True
+    if not conditional:
+        return set()
+    if hasattr(db, 'sql'):
+        return _sql_visible_issues(db, userid)
+    return _scan_visible_issues(db, userid)
+
+
+def _sql_visible_issues(db, userid):
+    # one query instead of a filter() per condition; retired issues
+    # are left in, they're not returned by filter() anyway.
+    sql = ('select id from _issue where _public=%(arg)s or _creator=%(arg)s'
+           ' union select nodeid from issue_nosy where linkid=%(arg)s'
+           % {'arg': db.arg})
+    public = db.to_sql_value(hyperdb.Boolean)(True)
+    db.sql(sql, (public, int(userid), int(userid)))
+    return set(str(row[0]) for row in db.cursor.fetchall())
+
+
+def _scan_visible_issues(db, userid):
+    visible = set()
+    for issueid in db.issue.getnodeids(retired=False):
+        node = db.issue.getnode(issueid)
+        if node.public or node.creator == userid or userid in node.nosy:
+            visible.add(issueid)
+    return visible
@@ -9,8 +9,13 @@
 #   creator = Link('user')
 #   actor = Link('user')
 
-# regexp used by S3ITIssueClass
-import re
+# used by S3ITIssueClass
+from roundup.i18n import _
+
+# used by public_or_owned_msg_file (see lib/issueindex.py)
+import issueindex
+# remembers the decisions of the issue, msg and file check functions
+from permcache import cached
 
 
 # Topic
@@ -110,68 +115,158 @@ file = FileClass(db, "file",
 #   superseder = Multilink("issue")
 
 class S3ITIssueClass(IssueClass):
-    """This class overrides `generateChangeNote` and `generateCreateNote`.
-
-    It is way too hackish, but it's a quick and dirty solution to use
-    the real name of the users in the assignee and nosy fields, in the email we send.
+    """This class overrides `generateChangeNote` and `generateCreateNote`,
+    to use the real name of the users in the assignee and nosy fields,
+    in the email we send: `username` is shown as `realname (username)`,
+    and `nosy` is called `subscribers`.
 
-    Basically, we call the methods of the parent, and we *parse the
-    output*, replacing `username` with `realname (username)`
+    The notes are built the same way the methods of the parent do it,
+    formatting the users directly instead of parsing the output.
     """
 
-    # Override generateChangeNote, to address S3IT issue384
-    def __fix_usernames_in_change_note(self, text):
-        lines = text.splitlines()
-        newlines = []
-        assignee_change_re = re.compile('assignee:\s+(?P<old>[^\s]+)\s+->\s+(?P<new>[^\s]+)')
-        assignee_create_re = re.compile('assignee:\s+(?P<old>[^\s]+)\s+')
-        nosy_re = re.compile('nosy:\s+(.*)')
-        for line in lines:
-            if assignee_change_re.match(line):
-                # Matches change in assignee
-                old, new = assignee_change_re.search(line).groups()
-                try:
-                    oldname = db.user.get(db.user.lookup(old), 'realname', old)
-                    newname = db.user.get(db.user.lookup(new), 'realname', new)
-                    newlines.append('assignee: {} ({}) -> {} ({})'.format(
-                        oldname, old, newname, new))
-                except KeyError:
-                    newlines.append(line)
-            elif assignee_create_re.match(line):
-                # Matches new assignee
-                assignee = assignee_create_re.search(line).group(1)
-                try:
-                    realname = db.user.get(db.user.lookup(assignee), 'realname', assignee)
-                    newlines.append('assignee: {} ({})'.format(
-                        assignee, realname))
-                except KeyError:
-                    newlines.append(line)
-            elif nosy_re.match(line):
-                # Matches changes in the nosy list
-                nosy = [i.strip() for i in nosy_re.search(line).group(1).split(',')]
-                newnosy = []
-                for user in nosy:
-                    username = user.strip('-+')
-                    prefix = user[0] if user[0] in '-+' else ''
-                    try:
-                        userid = db.user.lookup(username)
-                        realname = db.user.get(userid, 'realname', username)
-                        newnosy.append('{}{} ({})'.format(prefix, realname, username))
-                    except KeyError:
-                        newnosy.append(user)
-                # We also rename 'nosy' with 'subscribers'
-                newlines.append('subscribers: %s' % ', '.join(newnosy))
-            else:
-                newlines.append(line)
-        return '\n'.join(newlines)
+    # Link('user') properties shown as `realname (username)`
+    user_props = ('assignee', 'nosy')
+
+    # properties shown with a different name
+    prop_labels = {'nosy': 'subscribers'}
+
+    def __init__(self, db, classname, **properties):
+        IssueClass.__init__(self, db, classname, **properties)
+        # userid -> (username, "realname (username)"), emptied at the
+        # end of every transaction
+        self._user_labels = {}
+        db.registerClearCacheCallback(dict.clear, self._user_labels)
+
+    def _user_label(self, userid):
+        try:
+            return self._user_labels[userid]
+        except KeyError:
+            pass
+        username = self.db.user.get(userid, 'username')
+        realname = self.db.user.get(userid, 'realname') or username
+        label = self._user_labels[userid] = (username,
+                                             '%s (%s)' % (realname, username))
+        return label
+
+    def _link_label(self, prop, propname, value):
+        """Return the label of the item `value` of Link `prop`."""
+        if not value:
+            return ''
+        if propname in self.user_props:
+            return self._user_label(value)[1]
+        link = self.db.classes[prop.classname]
+        key = link.labelprop(default_to_id=1)
+        if key:
+            return link.get(value, key)
+        return value
+
+    def _multilink_labels(self, prop, propname, values):
+        """Return the sorted labels of the items `values` of Multilink
+        `prop`."""
+        if propname in self.user_props:
+            # sorted by username, as roundup does
+            return [label for username, label in
+                    sorted(self._user_label(value) for value in values)]
+        link = self.db.classes[prop.classname]
+        key = link.labelprop(default_to_id=1)
+        if key:
+            values = [link.get(value, key) for value in values]
+        return sorted(values)
 
+    # Override generateChangeNote, to address S3IT issue384
     def generateChangeNote(self, issueid, oldvalues):
-        m = IssueClass.generateChangeNote(self, issueid, oldvalues)
-        return self.__fix_usernames_in_change_note(m)
+        """Generate a change note that lists property changes
+        """
+        if not isinstance(oldvalues, type({})):
+            raise TypeError("'oldvalues' must be dict-like, not %s."%
+                type(oldvalues))
+
+        props = self.getprops(protected=0)
+
+        # determine what changed
+        changed = {}
+        for key in oldvalues.keys():
+            if key in ('files', 'messages', 'actor', 'activity', 'creator',
+                       'creation'):
+                continue
+            # not all keys from oldvalues might be available in database
+            # this happens when property was deleted
+            try:
+                new_value = self.get(issueid, key)
+            except KeyError:
+                continue
+            # the old value might be non existent
+            # this happens when property was added
+            try:
+                old_value = oldvalues[key]
+                if type(new_value) is type([]):
+                    new_value.sort()
+                    old_value.sort()
+                if new_value != old_value:
+                    changed[key] = old_value
+            except:
+                changed[key] = new_value
+
+        # list the changes
+        m = []
+        for propname, oldvalue in sorted(changed.items()):
+            prop = props[propname]
+            value = self.get(issueid, propname, None)
+            if isinstance(prop, Link):
+                change = '%s -> %s' % (self._link_label(prop, propname, oldvalue),
+                                       self._link_label(prop, propname, value))
+            elif isinstance(prop, Multilink):
+                value = value or []
+                oldvalue = oldvalue or []
+                change = []
+                added = [v for v in value if v not in oldvalue]
+                if added:
+                    change.append('+%s' % ', '.join(
+                        self._multilink_labels(prop, propname, added)))
+                removed = [v for v in oldvalue if v not in value]
+                if removed:
+                    change.append('-%s' % ', '.join(
+                        self._multilink_labels(prop, propname, removed)))
+                change = ' '.join(change)
+            else:
+                change = '%s -> %s'%(oldvalue, value)
+                if '\n' in change:
+                    value = self.indentChangeNoteValue(str(value))
+                    oldvalue = self.indentChangeNoteValue(str(oldvalue))
+                    change = _('\nNow:\n%(new)s\nWas:\n%(old)s') % {
+                        "new": value, "old": oldvalue}
+            m.append('%s: %s' % (self.prop_labels.get(propname, propname),
+                                 change))
+        if m:
+            m.insert(0, '----------')
+            m.insert(0, '')
+        return '\n'.join(m)
 
     def generateCreateNote(self, issueid):
-        m = IssueClass.generateCreateNote(self, issueid)
-        return self.__fix_usernames_in_change_note(m)
+        """Generate a create note that lists initial property values
+        """
+        props = self.getprops(protected=0)
+
+        # list the values
+        m = []
+        for propname, prop in sorted(props.items()):
+            value = self.get(issueid, propname, None)
+            # skip boring entries
+            if not value:
+                continue
+            if isinstance(prop, Link):
+                value = self._link_label(prop, propname, value)
+            elif isinstance(prop, Multilink):
+                value = ', '.join(self._multilink_labels(prop, propname, value))
+            else:
+                value = str(value)
+                if '\n' in value:
+                    value = '\n'+self.indentChangeNoteValue(value)
+            m.append('%s: %s' % (self.prop_labels.get(propname, propname),
+                                 value))
+        m.insert(0, '----------')
+        m.insert(0, '')
+        return '\n'.join(m)
 
 
 issue = S3ITIssueClass(db, "issue",
@@ -210,11 +305,12 @@ for r in 'User', 'Operator':
 # User permissions
 ##########################
 
-def public_or_owned_issue(db, userid, itemid):
-    item = db.issue.getnode(itemid)
-    return item.public or item.creator == userid or userid in item.nosy
+# lib/visibility.py computes the set of issues allowed by this check,
+# to filter the lists of issues
+from visibility import public_or_owned_issue
 
-p = db.security.addPermission(name='View', klass='issue', check=public_or_owned_issue,
+p = db.security.addPermission(name='View', klass='issue',
+    check=cached('View', 'issue', public_or_owned_issue),
     description="User is allowed to view its own issues, or public issues only.")
 db.security.addPermissionToRole('User', p)
 
@@ -223,7 +319,9 @@ def public_or_owned_msg_file(klass):
     attribute = {'msg': 'messages',
                  'file': 'files'}.get(klass)
     def belongs_to_public_issue(db, userid, itemid):
-        issueids = db.issue.find(**{attribute:str(itemid)})
+        issueids = issueindex.get_index(db.config.DATABASE).lookup(klass, itemid)
+        if issueids is None:
+            issueids = db.issue.find(**{attribute:str(itemid)})
         if not issueids: return None
 
         issue=db.issue.getnode(issueids[0])
@@ -231,7 +329,8 @@ def public_or_owned_msg_file(klass):
     return belongs_to_public_issue
 
 for klass in ['msg', 'file']:
-    p = db.security.addPermission(name='View', klass=klass, check=public_or_owned_msg_file(klass),
+    p = db.security.addPermission(name='View', klass=klass,
+        check=cached('View', klass, public_or_owned_msg_file(klass)),
         description="User is allowed messages and files of public issues or issues owned by him.")
     db.security.addPermissionToRole('User', p)
 
@@ -271,7 +370,8 @@ def checker(klass):
     else:
         return creator_or_public_issue
 
-p = db.security.addPermission(name='Edit', klass='file', check=checker('file'),
+p = db.security.addPermission(name='Edit', klass='file',
+    check=cached('Edit', 'file', checker('file')),
     description="User is allowed to remove their own files")
 db.security.addPermissionToRole('User', p)
 
@@ -286,7 +386,7 @@ p = db.security.addPermission(name='Edit', klass='issue',
                               properties=('title', 'topics', 'status',
                                           'messages', 'files', 'nosy'),
                               description='User can report and discuss issues',
-                              check=checker('issue'))
+                              check=cached('Edit', 'issue', checker('issue')))
 db.security.addPermissionToRole('User', p)
 
 # but can add comments to other people's issue
@@ -109,3 +109,32 @@ function default_organisation(orga) {
     }
 }
 
+
+/**
+ * Timezone selectors rendered with utils.tzfield(..., compact=True)
+ * only contain the selected timezone. The full list is loaded from
+ * the 'tzlist' action the first time the user opens the selector.
+ */
+function load_timezones(select) {
+    if (select.data('loaded')) {
+        return
+    }
+    select.data('loaded', true)
+    var current = select.val()
+    $.getJSON('?@action=tzlist', function(zones) {
+        select.empty()
+        $.each(zones, function(i, zone) {
+            var option = $('<option/>').val(zone).text(zone)
+            if (zone == current) {
+                option.attr('selected', 'selected')
+            }
+            select.append(option)
+        })
+    })
+}
+
+$(function() {
+    $('select.tzselect').one('focus mousedown', function() {
+        load_timezones($(this))
+    })
+})